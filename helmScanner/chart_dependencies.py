@@ -0,0 +1,130 @@
+"""
+Chart Dependency Resolver
+=========================
+
+Lists a chart's dependencies straight from the extracted chart, in the same shape `helm dependency list` output was parsed into,
+without a helm subprocess per chart.
+
+Dependencies are read from Chart.yaml for apiVersion v2 charts, and from requirements.yaml (or requirements.lock) for v1 charts.
+Each dependency's status follows helm's rules for vendored subcharts under charts/:
+'ok' for a matching archive, 'unpacked' for a matching directory, otherwise 'missing', 'misnamed', 'wrong version', 'invalid version' or 'corrupt'.
+"""
+
+import glob
+import logging as helmscanner_logging
+import os
+import re
+import tarfile
+
+import semantic_version
+import yaml
+
+# A 'v' prefixing a version inside a constraint, e.g. the one in '>=v1.2.0'. Only these are stripped, not every 'v' in the string.
+VERSION_PREFIX = re.compile(r'(?<![\w.+-])v(?=\d)')
+
+
+def _load_yaml(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def _archive_metadata(archivePath):
+    """
+    :return metadata: The Chart.yaml at the root of a packaged chart, or None if the archive can't be read or has none.
+    """
+    try:
+        with tarfile.open(archivePath, 'r:*') as tar:
+            for member in tar:
+                if member.isfile() and member.name.count('/') == 1 and member.name.endswith('/Chart.yaml'):
+                    return yaml.safe_load(tar.extractfile(member)) or {}
+    except (tarfile.TarError, OSError, yaml.YAMLError):
+        return None
+    return None
+
+
+def _version_matches(constraint, version):
+    """
+    :return matches: Whether version satisfies a helm (Masterminds semver) constraint. None if either can't be parsed.
+    """
+    if str(constraint) == str(version):
+        return True
+    try:
+        spec = semantic_version.NpmSpec(' '.join(VERSION_PREFIX.sub('', str(constraint)).replace(',', ' ').split()))
+        return semantic_version.Version.coerce(str(version).lstrip('v')) in spec
+    except ValueError:
+        return None
+
+
+def _metadata_status(metadata, dep, matchedStatus):
+    if metadata.get('name') != dep.get('name'):
+        return "misnamed"
+    matches = _version_matches(dep.get('version', ''), metadata.get('version', ''))
+    if matches is None:
+        return "invalid version"
+    return matchedStatus if matches else "wrong version"
+
+
+def _dependency_status(chartPath, dep, subcharts):
+    chartsPath = os.path.join(chartPath, 'charts')
+    archives = glob.glob(os.path.join(glob.escape(chartsPath), f"{glob.escape(str(dep.get('name')))}-*.tgz"))
+    if len(archives) > 1:
+        # Only archives named <name>-<semver>.tgz count, as with helm.
+        prefix = f"{dep.get('name')}-"
+        archives = [archive for archive in archives if semantic_version.validate(os.path.basename(archive)[len(prefix):-len('.tgz')])]
+        if len(archives) > 1:
+            return "too many matches"
+    if len(archives) == 1:
+        metadata = _archive_metadata(archives[0])
+        if metadata is None:
+            return "corrupt"
+        return _metadata_status(metadata, dep, "ok")
+    # Fall back to unpacked subcharts, which helm matches by chart name rather than directory name.
+    metadata = subcharts.get(dep.get('name'))
+    if metadata is None:
+        return "missing"
+    return _metadata_status(metadata, dep, "unpacked")
+
+
+def _unpacked_subcharts(chartPath):
+    subcharts = {}
+    for chartYaml in glob.glob(os.path.join(glob.escape(chartPath), 'charts', '*', 'Chart.yaml')):
+        try:
+            metadata = _load_yaml(chartYaml)
+        except yaml.YAMLError:
+            continue
+        if metadata and metadata.get('name'):
+            subcharts[metadata['name']] = metadata
+    return subcharts
+
+
+def chart_dependencies(chartPath):
+    """
+    :param chartPath: Directory of an extracted chart, containing its Chart.yaml.
+    :return chart_dependencies: Dict of dependency name to {'chart_name', 'chart_version', 'chart_repo', 'chart_status'}, empty if the chart has none.
+    """
+    chart = _load_yaml(os.path.join(chartPath, 'Chart.yaml'))
+    if chart is None:
+        helmscanner_logging.warning(f"No Chart.yaml found in {chartPath}, skipping chart dependency list")
+        return {}
+    if chart.get('apiVersion', 'v1') == 'v1':
+        requirements = _load_yaml(os.path.join(chartPath, 'requirements.yaml'))
+        if requirements is None:
+            requirements = _load_yaml(os.path.join(chartPath, 'requirements.lock')) or {}
+        dependencies = requirements.get('dependencies') or []
+    else:
+        dependencies = chart.get('dependencies') or []
+
+    chart_dependencies = {}
+    subcharts = _unpacked_subcharts(chartPath) if dependencies else {}
+    for dep in dependencies:
+        if not isinstance(dep, dict) or not dep.get('name'):
+            continue
+        chart_name = str(dep['name']).rstrip()
+        chart_dependencies.update({chart_name: {
+            'chart_name': chart_name,
+            'chart_version': str(dep.get('version', '')).rstrip(),
+            'chart_repo': str(dep.get('repository', '')).rstrip(),
+            'chart_status': _dependency_status(chartPath, dep, subcharts)}})
+    return chart_dependencies
@@ -0,0 +1,135 @@
+"""
+Chart Renderer
+==============
+
+Renders each chart with `helm template` exactly once. The rendered manifests are shared by image discovery and the Checkov Kubernetes scan,
+rather than the chart being templated again inside Checkov's helm runner.
+Rendered output is cached on disk by a hash of the chart's content, so identical charts in mirrored repos are only rendered once.
+A chart that fails to render is tried again with `--dependency-update`, which fetches dependencies its archive doesn't bundle.
+
+:env RENDER_CACHE_PATH: Directory holding cached renders (default rendered/ in the helm-scanner cache dir).
+:env RENDER_CACHE_MAX_BYTES: Size budget for cached renders in bytes, oldest pruned first when a run starts (default 2GiB).
+"""
+
+import hashlib
+import logging as helmscanner_logging
+import os
+import subprocess  # nosec
+import threading
+
+from helmScanner.scannerCache import cachePath
+
+SOURCE_PREFIX = '# Source: '
+
+
+def chart_content_hash(chartPath):
+    """
+    :return hash: sha256 hex digest over the relative path and content of every file in the chart.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(chartPath):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, chartPath).encode('utf-8') + b'\0')
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(64 * 1024), b''):
+                    digest.update(block)
+            digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class RenderCache:
+
+    def __init__(self, path, maxBytes):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._prune(maxBytes)
+
+    def _prune(self, maxBytes):
+        renders = sorted((entry for entry in os.scandir(self.path) if entry.is_file()), key=lambda entry: entry.stat().st_mtime, reverse=True)
+        totalBytes = 0
+        for entry in renders:
+            totalBytes += entry.stat().st_size
+            if totalBytes > maxBytes:
+                os.remove(entry.path)
+
+    def get(self, contentHash):
+        path = os.path.join(self.path, f"{contentHash}.yaml")
+        try:
+            with open(path) as f:
+                rendered = f.read()
+        except FileNotFoundError:
+            return None
+        os.utime(path)
+        return rendered
+
+    def put(self, contentHash, rendered):
+        path = os.path.join(self.path, f"{contentHash}.yaml")
+        partialPath = f"{path}.{threading.get_ident()}.part"
+        with open(partialPath, 'w') as f:
+            f.write(rendered)
+        os.replace(partialPath, path)
+
+
+renderCache = RenderCache(os.environ.get('RENDER_CACHE_PATH') or cachePath('rendered'),
+                          int(os.environ.get('RENDER_CACHE_MAX_BYTES', default=2 * 1024 ** 3)))
+
+
+def render(chartPath):
+    """
+    Render a chart with its default values, reusing a cached render of identical chart content if there is one.
+
+    :return rendered: The `helm template` output, or None if the chart failed to render.
+    """
+    contentHash = chart_content_hash(chartPath)
+    rendered = renderCache.get(contentHash)
+    if rendered is not None:
+        helmscanner_logging.info(f"Using cached render of {chartPath}")
+        return rendered
+    rendered, err = _helm_template(chartPath)
+    if rendered is None:
+        # Charts whose dependencies aren't bundled in their archive only render once helm has fetched them, as Checkov's helm runner used to.
+        helmscanner_logging.info(f"Rendering {chartPath} again with its dependencies updated")
+        rendered, err = _helm_template(chartPath, '--dependency-update')
+    if rendered is None:
+        helmscanner_logging.warning(f"Failed to render {chartPath}. Error details: {err}")
+        return None
+    renderCache.put(contentHash, rendered)
+    return rendered
+
+
+def _helm_template(chartPath, *flags):
+    """
+    :return rendered, err: The `helm template` output, or None and helm's stderr if it failed.
+    """
+    helmout = subprocess.Popen(["helm", 'template', chartPath, *flags], stdout=subprocess.PIPE, stderr=subprocess.PIPE)  # nosec
+    out, err = helmout.communicate()
+    if helmout.returncode != 0:
+        return None, str(err, 'utf-8')
+    return out.decode('utf-8'), None
+
+
+def write_manifests(rendered, manifestPath):
+    """
+    Write rendered manifests out as one file per source template (following helm's `# Source:` markers), so scan results point at the template they came from.
+
+    :return manifestPath: The directory written to.
+    """
+    os.makedirs(manifestPath, exist_ok=True)
+    root = os.path.abspath(manifestPath)
+    manifests = {}
+    source = 'manifest.yaml'
+    for line in rendered.splitlines(keepends=True):
+        if line.startswith(SOURCE_PREFIX):
+            source = line[len(SOURCE_PREFIX):].strip()
+            manifests.setdefault(source, []).append('---\n')
+        manifests.setdefault(source, []).append(line)
+    for source, lines in manifests.items():
+        path = os.path.abspath(os.path.join(root, source))
+        if not path.startswith(root + os.sep):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.writelines(lines)
+    return manifestPath
@@ -0,0 +1,88 @@
+"""
+Checkov Result Cache
+====================
+
+Persists Checkov results between charts and runs, keyed on a hash of the rendered manifests.
+Forks, mirrors and vendored copies of a chart render to the same manifests, so only the first copy is scanned;
+the rest reuse its passed and failed checks, and only their repository and package columns differ.
+
+The Checkov version, the set of kubernetes checks and RESULTS_FORMAT are part of every key, so upgrading Checkov, changing its checks
+or changing how results are produced never reuses old results. Empty renders are never cached.
+
+:env CHECKOV_CACHE_PATH: SQLite file holding the cache (default checkov-cache.sqlite in the helm-scanner cache dir). Set to an empty string to disable caching.
+"""
+
+import hashlib
+import json
+import logging as helmscanner_logging
+import os
+import sqlite3
+import threading
+
+from helmScanner.scannerCache import cachePath
+
+# Part of every key. Bump it when the shape or meaning of cached results changes, e.g. results written when rendered manifests
+# under hidden scratch dirs were silently skipped by Checkov (format 1), so older entries are never read again.
+RESULTS_FORMAT = 2
+
+
+def checks_fingerprint():
+    """
+    :return fingerprint: Hash of the Checkov version and the ids of every registered kubernetes check.
+    """
+    from checkov.kubernetes.registry import registry
+    from checkov.version import version
+    checkIds = sorted({check.id for checks in registry.checks.values() for check in checks})
+    return hashlib.sha256(json.dumps([version, checkIds]).encode()).hexdigest()
+
+
+class CheckovCache:
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    manifest_hash TEXT PRIMARY KEY,
+                    results TEXT NOT NULL
+                )""")
+
+    def _key(self, rendered):
+        return hashlib.sha256(f"{RESULTS_FORMAT}\n{self.fingerprint}\n{rendered}".encode()).hexdigest()
+
+    def get(self, rendered):
+        """
+        :param rendered: Rendered manifests, as returned by chart_renderer.render.
+        :return results: The cached checkov_worker.scan_manifests results for these manifests, or None.
+        """
+        if not rendered:
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT results FROM results WHERE manifest_hash = ?", (self._key(rendered),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, rendered, results):
+        # A chart that renders to nothing has nothing to reuse, and scanning nothing again costs nothing.
+        if not rendered:
+            return
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO results (manifest_hash, results) VALUES (?, ?)", (self._key(rendered), json.dumps(results)))
+
+
+def open_cache():
+    """
+    :return cache: CheckovCache at CHECKOV_CACHE_PATH, or None if caching is disabled or the cache can't be opened.
+    """
+    path = os.environ.get('CHECKOV_CACHE_PATH')
+    if path is None:
+        path = cachePath('checkov-cache.sqlite')
+    if not path:
+        return None
+    try:
+        return CheckovCache(path, checks_fingerprint())
+    except sqlite3.Error as err:
+        helmscanner_logging.warning(f'Unable to open checkov cache at {path}, scanning without it: {err}')
+        return None
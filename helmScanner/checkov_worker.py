@@ -0,0 +1,59 @@
+"""
+Checkov Worker
+==============
+
+Checkov's policy evaluation is CPU bound Python, so it runs in worker processes on the scheduler's checkov lane rather than in threads sharing one GIL.
+Workers are persistent: they are forked from a fork server which has already imported checkov and registered its checks,
+and reuse the registry for every chart they scan. They never import the runner, or open its clients and caches.
+Each scan is returned to the parent as a small dict of tuples instead of a checkov Report.
+"""
+
+import logging as helmscanner_logging
+import os
+
+# Modules the fork server imports once, for every worker to share.
+PRELOAD = ('helmScanner.checkov_worker', 'checkov.logging_init', 'checkov.kubernetes.runner')
+# Fields kept from each checkov check result, in order.
+CHECK_FIELDS = ('check_id', 'check_name', 'check_result', 'file_path', 'check_class', 'resource')
+
+
+def init_worker():
+    # Importing the runner registers every kubernetes check; this is normally already done in the fork server, by PRELOAD.
+    from checkov.logging_init import init as logging_init
+    import checkov.kubernetes.runner  # noqa: F401
+    logging_init()
+    helmscanner_logging.debug("Checkov worker ready")
+
+
+def _compact(check, manifestPath):
+    # File paths are reported relative to the manifest dir, as '/<chart>/templates/<file>', not as the scratch path they were scanned at.
+    filePath = '/' + os.path.relpath(check['file_path'], manifestPath).replace(os.sep, '/')
+    return (check['check_id'], check['check_name'], str(check['check_result']['result']), filePath, check['check_class'], check['resource'])
+
+
+def _manifest_files(manifestPath, endings):
+    for root, dirs, files in os.walk(manifestPath):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1] in endings:
+                yield os.path.abspath(os.path.join(root, name))
+
+
+def scan_manifests(manifestPath):
+    """
+    Run checkov's kubernetes checks over a directory of rendered manifests.
+
+    :return results: Dict with 'passed' and 'failed' lists of CHECK_FIELDS tuples, the checkov 'summary' counts, and 'empty' if there was nothing to check.
+    """
+    from checkov.kubernetes.runner import K8_POSSIBLE_ENDINGS, Runner as k8_runner
+    # The files are listed here rather than passing root_folder, since checkov drops any file whose path contains '/.' when it walks a folder,
+    # which would silently skip every manifest under a hidden directory such as a SCRATCH_PATH in ~/.cache.
+    files = list(_manifest_files(manifestPath, K8_POSSIBLE_ENDINGS))
+    report = k8_runner().run(root_folder=None, external_checks_dir=None, files=files)
+    res = report.get_dict()
+    return {
+        'passed': [_compact(check, manifestPath) for check in res["results"]["passed_checks"]],
+        'failed': [_compact(check, manifestPath) for check in res["results"]["failed_checks"]],
+        'summary': {key: res["summary"][key] for key in ('passed', 'failed', 'parsing_errors')},
+        'empty': report.is_empty(),
+    }
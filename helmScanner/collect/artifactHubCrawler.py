@@ -7,21 +7,34 @@ Steve Giguere <eurogig@gmail.com>
 
 :env ARTIFACTHUB_TOKEN: API token from artifacthub.io
 :env ARTIFACTHUB_TOKEN_SECRET: API secret from artifacthub.io
+:env CRAWL_CACHE_PATH: Where unchanged repositories are cached between crawls, see crawl_cache.
+:env ARTIFACTHUB_RATE: Request rate limit for ArtifactHub calls, see request_scheduler.
 """
 
+import concurrent.futures
 import logging as helmscanner_logging
 import logging.handlers
 import os
 import pickle
+import queue
+import threading
 from urllib.parse import urlparse
 
 #ArtifacrHubCrawler Imports
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
 
+from helmScanner.collect import crawl_cache
+from helmScanner.collect.request_scheduler import RequestScheduler
+
+ARTIFACTHUB_API_URL = "https://artifacthub.io/api/v1"
+# Marks the end of the crawl on the repo queue used by _stream_repos.
+_CRAWL_DONE = object()
+
 class ArtifactHubCrawler:
 
-    def __init__(self):
+    def __init__(self, concurrency=None):
 
         logfile = "./artifacthub-crawler.log"
 
@@ -48,10 +61,187 @@ class ArtifactHubCrawler:
             logger.warning("No env ARTIFACTHUB_TOKEN_SECRET found")
             exit()
 
+        # One pooled session for every ArtifactHub call, sized to the concurrency cap so threads never wait on a connection.
+        self.concurrency = concurrency or int(os.environ.get('CRAWL_CONCURRENCY', default=16))
+        self.session = requests.Session()
+        self.session.headers.update({'X-API-KEY-ID': self.ARTIFACTHUB_TOKEN, 'X-API-KEY-SECRET': self.ARTIFACTHUB_TOKEN_SECRET})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.scheduler = RequestScheduler(self.session, maxConcurrency=self.concurrency)
+        self.cache = crawl_cache.open_cache()
+
+    def _get(self, uri):
+        """
+        GET an ArtifactHub API path over the shared session. The scheduler rate limits the call and retries it when throttled.
+
+        :param uri: API path relative to ARTIFACTHUB_API_URL, including any query string.
+        :return response: The requests response, raised for HTTP error status.
+        """
+        response = self.scheduler.get(f"{ARTIFACTHUB_API_URL}/{uri}")
+        response.raise_for_status()
+        return response
+
+    def _crawl_repo_pages(self, executor, start_record, max_records, reposPerRequest):
+        """
+        Fetch the first page of Helm repositories to learn the total count, then fetch the remaining pages concurrently.
+
+        :return jsonResponse: List of repository results, in ArtifactHub search order, capped at max_records.
+        """
+        response = self._get(f"repositories/search?offset={start_record}&limit={reposPerRequest}&kind=0")
+        totalCount = int(response.headers["pagination-total-count"])
+        maxRepos = min(max(totalCount - start_record, 0), max_records)
+        self.logger.info(f"Found max repos {maxRepos}")
+        jsonResponse = response.json()
+        # A short first page means there is nothing further to fetch.
+        if len(jsonResponse) < reposPerRequest:
+            maxRepos = min(maxRepos, len(jsonResponse))
+        offsets = range(start_record + reposPerRequest, start_record + maxRepos, reposPerRequest)
+        pages = executor.map(lambda offset: self._get(f"repositories/search?offset={offset}&limit={reposPerRequest}&kind=0").json(), offsets)
+        for page in pages:
+            jsonResponse += page
+        return jsonResponse[:maxRepos]
+
+    def _crawl_package(self, repoResult, chartPackage):
+        # Downloads and package version details for each package.
+        try:
+            return self._get(f"packages/helm/{repoResult['name']}/{chartPackage['name']}").json()
+        except HTTPError as http_err:
+            helmscanner_logging.warning(f'HTTP error occurred: {http_err}')
+        except Exception as err:
+            helmscanner_logging.warning(f'Other error occurred: {err}')
+        return None
+
+    def _crawl_repo_packages(self, packageExecutor, repoResult, packagesPerRequest=60):
+        """
+        Search for every package in a repository. The first page gives the total count, and the remaining pages are fetched concurrently on packageExecutor.
+
+        :return packages: List of package search results for the repository, in search order.
+        """
+        packagesQueryURI = f"packages/search?limit={packagesPerRequest}&facets=false&kind=0&repo={repoResult['name']}"
+        response = self._get(f"{packagesQueryURI}&offset=0")
+        packages = response.json()['packages']
+        totalCount = int(response.headers.get("pagination-total-count", len(packages)))
+        offsets = range(packagesPerRequest, totalCount, packagesPerRequest)
+        for page in packageExecutor.map(lambda offset: self._get(f"{packagesQueryURI}&offset={offset}").json()['packages'], offsets):
+            packages += page
+        return packages
+
+    def _crawl_repo(self, packageExecutor, currentRepo, totalRepos, repoResult):
+        """
+        Resolve the packages of a single repository, fetching every package's details concurrently on packageExecutor.
+
+        :return thisRepoDict: The crawlDict entry for this repository.
+        """
+        thisRepoDict = {}
+        try:
+            repoOrgName = repoResult['organization_name']
+        except:
+            repoOrgName = repoResult['user_alias']
+        cachedPackages = self.cache.get(repoResult) if self.cache else None
+        if cachedPackages is not None:
+            self.logger.info(f"{currentRepo}/{totalRepos} | Repo {repoResult['name']} by {repoOrgName} unchanged, using {len(cachedPackages)} cached packages")
+            return {"repoName": repoResult['name'], "repoOrgName": repoOrgName, "repoCrawlResultsID": currentRepo, "repoTotalPackages": len(cachedPackages), "repoRaw": repoResult, "repoPackages": cachedPackages }
+        try:
+            # Packages within a repo
+            self.logger.info(f"{currentRepo}/{totalRepos} | Processing Repo {repoResult['name']} by {repoOrgName}")
+            chartPackages = self._crawl_repo_packages(packageExecutor, repoResult)
+            chartPackagesInRepo = len(chartPackages)
+            self.logger.debug(f"{currentRepo}/{totalRepos} | found {chartPackagesInRepo} packages.")
+            thisRepoDict = {"repoName": repoResult['name'], "repoOrgName": repoOrgName, "repoCrawlResultsID": currentRepo, "repoTotalPackages": chartPackagesInRepo, "repoRaw": repoResult, "repoPackages": [] }
+            futures = [packageExecutor.submit(self._crawl_package, repoResult, chartPackage) for chartPackage in chartPackages]
+            for currentChartPackage, future in enumerate(futures, start=1):
+                chartVersionResponse = future.result()
+                if chartVersionResponse is None:
+                    continue
+                self.logger.debug(f"        R: {currentRepo}/{totalRepos} | P: {currentChartPackage}/{chartPackagesInRepo} | Chart {chartVersionResponse['name']} latest version: {chartVersionResponse['version']} URL: {chartVersionResponse['content_url']}")
+                thisRepoDict['repoPackages'].append(chartVersionResponse)
+            # Only a complete package list is safe to reuse while the digest stays the same.
+            if self.cache and len(thisRepoDict['repoPackages']) == chartPackagesInRepo:
+                self.cache.put(repoResult, thisRepoDict['repoPackages'])
+        except HTTPError as http_err:
+            helmscanner_logging.warning(f'HTTP error occurred: {http_err}')
+        except Exception as err:
+            helmscanner_logging.warning(f'Other error occurred: {err}')
+        return thisRepoDict
+
+    def _stream_repos(self, maxQueued):
+        """
+        Run the crawl on a background thread, yielding (currentRepo, thisRepoDict) as each repository's packages are resolved.
+        At most maxQueued resolved repositories wait on the queue; once it is full the crawl workers block until the consumer catches up.
+        """
+        repoQueue = queue.Queue(maxsize=maxQueued)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    repoQueue.put(item, timeout=1)
+                    return
+                except queue.Full:
+                    continue
+
+        def crawl_repo(packageExecutor, currentRepo, totalRepos, repoResult):
+            put((currentRepo, self._crawl_repo(packageExecutor, currentRepo, totalRepos, repoResult)))
+
+        def produce():
+            reposPerRequest = 60
+            start_record = int(os.environ.get('START_RECORD',default=0))
+            max_records = int(os.environ.get('MAX_RECORDS',default=300))
+            helmscanner_logging.info(f"Artifacthub Helm crawler started with concurrency {self.concurrency}.")
+            # Repos and packages get separate pools so a repo waiting on its package details can never starve them of workers.
+            # The number of requests actually in flight is capped by self.scheduler.
+            # The repo pool is shut down (and its repos finished) first, since running repos still submit to the package pool.
+            try:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as packageExecutor, \
+                     concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency) as repoExecutor:
+                    helmscanner_logging.info("Receiving latest ArtifactHub repo results.")
+                    jsonResponse = self._crawl_repo_pages(repoExecutor, start_record, max_records, reposPerRequest)
+                    self.totalRepos = len(jsonResponse)
+                    self.logger.info(f"Found {self.totalRepos} Helm repositories.")
+                    for currentRepo, repoResult in enumerate(jsonResponse, start=1):
+                        repoExecutor.submit(crawl_repo, packageExecutor, currentRepo, self.totalRepos, repoResult)
+            except HTTPError as http_err:
+                helmscanner_logging.warning(f'HTTP error occurred: {http_err}')
+            except Exception as err:
+                helmscanner_logging.warning(f'Other error occurred: {err}')
+            finally:
+                put(_CRAWL_DONE)
+
+        self.totalRepos = 0
+        self.totalPackages = 0
+        producer = threading.Thread(target=produce, name="artifactHubCrawler", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = repoQueue.get()
+                if item is _CRAWL_DONE:
+                    break
+                self.totalPackages += len(item[1].get('repoPackages', []))
+                yield item
+        finally:
+            # Unblock the crawl workers if the consumer stops early.
+            stopped.set()
+
+    def crawl_stream(self, maxQueued=None):
+        """
+        crawl_stream is the streaming form of crawl(). Rather than building the whole crawlDict, it yields each repository's thisRepoDict as soon as its packages are resolved.
+        Repositories are yielded in completion order; repoCrawlResultsID still records their position in the ArtifactHub search.
+        Repositories which failed to resolve are logged and skipped.
+        totalRepos and totalPackages are available as attributes on the crawler once the generator is exhausted.
+
+        :param maxQueued: Resolved repositories allowed to wait for a consumer before the crawl blocks (env CRAWL_QUEUE_SIZE, default 8).
+        :return: Generator of thisRepoDict entries, as found in crawlDict.
+        """
+        maxQueued = maxQueued or int(os.environ.get('CRAWL_QUEUE_SIZE', default=8))
+        for currentRepo, thisRepoDict in self._stream_repos(maxQueued):
+            if thisRepoDict:
+                yield thisRepoDict
+
     def crawl(self):
         """
         crawl uses the HELM search functioanlity of artifacthub.io to find all helm *repositories* which may contain multiple charts.
         It then queries each repository to find charts, and uses the direct download link for each chart to get the latest .tgz.
+        Repo pages, package searches and package details are fetched concurrently, with at most `concurrency` requests (env CRAWL_CONCURRENCY) in flight.
         The chart is extracted and location recorded.
         Testing/Debugging: We also then dump the dictionary to a pickle file: artifactHubCrawler.crawl.pickle, which was historically useful for inspecting the data post-run.
         
@@ -60,77 +250,10 @@ class ArtifactHubCrawler:
         :return totalPackages: Integer stat of total Chart's within all discovered repo's 
 
         """
-        crawlDict = {}
-        totalPackages = 0
-        reposPerRequest = 60
-        start_record = int(os.environ.get('START_RECORD',default=0))
-        max_records = int(os.environ.get('MAX_RECORDS',default=300))
-        helmscanner_logging.info("Artifacthub Helm crawler started.")
-        try:
-            currentRepo = 0
-            headers = {'X-API-KEY-ID': self.ARTIFACTHUB_TOKEN, 'X-API-KEY-SECRET': self.ARTIFACTHUB_TOKEN_SECRET}
-            helmscanner_logging.info("Receiving latest ArtifactHub repo results.")
-            response = requests.get(f"https://artifacthub.io/api/v1/repositories/search?offset={start_record}&limit={reposPerRequest}&kind=0", headers=headers)
-            response.raise_for_status()
-            maxRepos = int(response.headers["pagination-total-count"]) if max_records > int(response.headers["pagination-total-count"]) else max_records
-            self.logger.info(f"Found max repos {maxRepos}")
-            jsonResponse = response.json()
-            totalRepos = len(jsonResponse)
-            # readjust maxRepos in the case we have a short list of responses returned
-            maxRepos = totalRepos if maxRepos > totalRepos else maxRepos          
-            offset = start_record + reposPerRequest
-            while (maxRepos > totalRepos):
-                # Get the rest of the repos
-                response = requests.get(f"https://artifacthub.io/api/v1/repositories/search?offset={offset}&limit={reposPerRequest}&kind=0", headers=headers)
-                response.raise_for_status()
-                jsonResponse += response.json()
-                totalRepos += len(response.json())
-                offset += reposPerRequest
-
-            self.logger.info(f"Found {totalRepos} Helm repositories.")
-            for repoResult in jsonResponse:
-                thisRepoDict = {}
-                currentRepo += 1
-                try:
-                    repoOrgName = repoResult['organization_name']
-                except:
-                    repoOrgName = repoResult['user_alias']
-                try:
-                    # Packages within a repo
-                    self.logger.info(f"{currentRepo}/{totalRepos} | Processing Repo {repoResult['name']} by {repoOrgName}")
-                    packagesQueryURI = f"https://artifacthub.io/api/v1/packages/search?limit=60&facets=false&kind=0&repo={repoResult['name']}"
-                    response = requests.get(packagesQueryURI, headers=headers)
-                    chartPackages = response.json()
-                    chartPackagesInRepo = len(chartPackages['packages'])
-                    self.logger.debug(f"{currentRepo}/{totalRepos} | found {chartPackagesInRepo} packages.")
-                    thisRepoDict = {"repoName": repoResult['name'], "repoOrgName": repoOrgName, "repoCrawlResultsID": currentRepo, "repoTotalPackages": chartPackagesInRepo, "repoRaw": repoResult, "repoPackages": [] }
-                    currentChartPackage = 0
-                    for chartPackage in chartPackages['packages']:
-                        currentChartPackage += 1
-                        totalPackages +=1
-                        try:
-                            # Downloads and package version details for each package.
-                            response = requests.get(f"https://artifacthub.io/api/v1/packages/helm/{repoResult['name']}/{chartPackage['name']}", headers=headers)
-                            chartVersionResponse = response.json()
-                            self.logger.debug(f"        R: {currentRepo}/{totalRepos} | P: {currentChartPackage}/{chartPackagesInRepo} | Chart {chartPackage['name']} latest version: {chartVersionResponse['version']} URL: {chartVersionResponse['content_url']}")
-                            thisRepoDict['repoPackages'].append(chartVersionResponse)
-                        except HTTPError as http_err:
-                           helmscanner_logging.warning(f'HTTP error occurred: {http_err}')
-                        except Exception as err:
-                            helmscanner_logging.warning(f'Other error occurred: {err}')
-                except HTTPError as http_err:
-                    helmscanner_logging.warning(f'HTTP error occurred: {http_err}')
-                except Exception as err:
-                    helmscanner_logging.warning(f'Other error occurred: {err}')
-                #Save this repo's packages into our main crawler dict.
-                crawlDict[currentRepo] = thisRepoDict
-        except HTTPError as http_err:
-            helmscanner_logging.warning(f'HTTP error occurred: {http_err}')
-        except Exception as err:
-            helmscanner_logging.warning(f'Other error occurred: {err}')
+        crawlDict = dict(sorted(self._stream_repos(maxQueued=0)))
         with open('artifactHubCrawler.crawl.pickle', 'wb') as f:
             pickle.dump(crawlDict, f, pickle.HIGHEST_PROTOCOL)
-        return crawlDict, totalRepos, totalPackages 
+        return crawlDict, self.totalRepos, self.totalPackages 
 
     def mockCrawl(self):
         """
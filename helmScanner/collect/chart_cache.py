@@ -0,0 +1,188 @@
+"""
+Chart Archive Cache
+===================
+
+Keeps downloaded chart archives on disk between runs, content addressed by the chart's download URL, version and package digest.
+An unchanged chart is served from the cache instead of being downloaded again.
+The cache is held under a size budget, evicting the least recently used archives first. Archives checked out by a running scan are never evicted.
+Missing archives are fetched by the ChartDownloader in the background, so a scan can have the next charts downloading while it works on the current one.
+
+:env CHART_CACHE_PATH: Directory holding cached chart archives (default charts/ in the helm-scanner cache dir).
+:env CHART_CACHE_MAX_BYTES: Size budget for the cache in bytes (default 10GiB).
+:env DOWNLOAD_PREFETCH: Charts downloaded ahead of the one being scanned, per org (default 4).
+"""
+
+import concurrent.futures
+import hashlib
+import logging as helmscanner_logging
+import os
+import threading
+from collections import OrderedDict, deque
+
+from helmScanner.collect.chart_downloader import ChartDownloader
+from helmScanner.scannerCache import cachePath
+
+
+class ChartCheckout:
+    """
+    A cached chart archive pinned against eviction, possibly still downloading.
+    Entering the context waits for the download and gives the archive path; leaving it releases the pin.
+    """
+
+    def __init__(self, cache, key, future):
+        self.cache = cache
+        self.key = key
+        self.future = future
+        self.released = False
+
+    @classmethod
+    def failed(cls, err):
+        future = concurrent.futures.Future()
+        future.set_exception(err)
+        return cls(None, None, future)
+
+    def release(self):
+        if not self.released and self.key is not None:
+            self.released = True
+            self.cache._unpin(self.key)
+
+    def __enter__(self):
+        try:
+            return self.future.result()
+        except:
+            self.release()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class ChartCache:
+
+    def __init__(self, path, maxBytes, downloader=None):
+        self.path = path
+        self.maxBytes = maxBytes
+        self.downloader = downloader or ChartDownloader()
+        self.lock = threading.Lock()
+        self.pinned = {}
+        self.inflight = {}
+        os.makedirs(path, exist_ok=True)
+        # Rebuild the LRU order from the last time each archive was used, oldest first.
+        self.entries = OrderedDict()
+        self.totalBytes = 0
+        archives = [entry for entry in os.scandir(path) if entry.is_file() and entry.name.endswith('.tgz')]
+        for entry in sorted(archives, key=lambda entry: entry.stat().st_mtime):
+            self.entries[entry.name[:-len('.tgz')]] = entry.stat().st_size
+            self.totalBytes += entry.stat().st_size
+        helmscanner_logging.info(f"Chart cache at {path} holds {len(self.entries)} archives, {self.totalBytes} bytes")
+
+    @staticmethod
+    def key(contentUrl, version=None, digest=None):
+        return hashlib.sha256(f"{contentUrl}\n{version}\n{digest}".encode('utf-8')).hexdigest()
+
+    def _archive_path(self, key):
+        return os.path.join(self.path, f"{key}.tgz")
+
+    def _download(self, contentUrl, key):
+        archivePath = self._archive_path(key)
+        partialPath = f"{archivePath}.{threading.get_ident()}.part"
+        try:
+            size = self.downloader.download(contentUrl, partialPath)
+            os.replace(partialPath, archivePath)
+        except:
+            if os.path.exists(partialPath):
+                os.remove(partialPath)
+            with self.lock:
+                self.inflight.pop(key, None)
+            raise
+        # Moved from in flight to cached in one step, so a checkout never finds it in neither and downloads it again.
+        with self.lock:
+            self.inflight.pop(key, None)
+            if key not in self.entries:
+                self.entries[key] = size
+                self.totalBytes += size
+            self.entries.move_to_end(key)
+            self._evict()
+        return archivePath
+
+    def _evict(self):
+        for key in list(self.entries):
+            if self.totalBytes <= self.maxBytes:
+                return
+            if key in self.pinned:
+                continue
+            size = self.entries.pop(key)
+            self.totalBytes -= size
+            try:
+                os.remove(self._archive_path(key))
+            except FileNotFoundError:
+                pass
+            helmscanner_logging.debug(f"Evicted chart archive {key} from cache")
+
+    def _unpin(self, key):
+        with self.lock:
+            self.pinned[key] -= 1
+            if not self.pinned[key]:
+                del self.pinned[key]
+            self._evict()
+
+    def checkout(self, contentUrl, version=None, digest=None):
+        """
+        Pin a chart archive in the cache, starting its download in the background if it isn't cached or already downloading.
+
+        :param contentUrl: Download URL of the chart archive.
+        :param version: Chart version, part of the cache key.
+        :param digest: ArtifactHub package digest, part of the cache key.
+        :return checkout: ChartCheckout, used as a context manager giving the path of the cached .tgz.
+        """
+        key = self.key(contentUrl, version, digest)
+        with self.lock:
+            self.pinned[key] = self.pinned.get(key, 0) + 1
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                future = concurrent.futures.Future()
+                future.set_result(self._archive_path(key))
+                cached = True
+            else:
+                future = self.inflight.get(key)
+                if future is None:
+                    future = self.inflight[key] = self.downloader.submit(contentUrl, self._download, contentUrl, key)
+                cached = False
+        if cached:
+            helmscanner_logging.debug(f"Chart cache hit for {contentUrl}")
+            try:
+                os.utime(future.result())
+            except FileNotFoundError:
+                pass
+        return ChartCheckout(self, key, future)
+
+    def checkouts(self, chartPackages, ahead=None):
+        """
+        Generator of (chartPackage, ChartCheckout) for ArtifactHub package details. The next `ahead` charts are already downloading while the caller scans the current one.
+        """
+        ahead = ahead if ahead is not None else int(os.environ.get('DOWNLOAD_PREFETCH', default=4))
+        pending = deque()
+        try:
+            for chartPackage in chartPackages:
+                try:
+                    checkout = self.checkout(chartPackage['content_url'], chartPackage['version'], chartPackage.get('digest'))
+                except Exception as err:
+                    # Surface bad package details as a failed download when the caller enters the checkout.
+                    checkout = ChartCheckout.failed(err)
+                pending.append((chartPackage, checkout))
+                if len(pending) > ahead:
+                    yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+        finally:
+            for chartPackage, checkout in pending:
+                checkout.release()
+
+
+def open_cache():
+    """
+    :return cache: ChartCache at CHART_CACHE_PATH with a CHART_CACHE_MAX_BYTES budget.
+    """
+    path = os.environ.get('CHART_CACHE_PATH') or cachePath('charts')
+    maxBytes = int(os.environ.get('CHART_CACHE_MAX_BYTES', default=10 * 1024 ** 3))
+    return ChartCache(path, maxBytes)
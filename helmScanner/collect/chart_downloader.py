@@ -0,0 +1,107 @@
+"""
+Chart Downloader
+================
+
+Downloads chart archives over persistent per-host connection pools. Charts mostly come from a handful of hosts (GitHub Pages, chart museums),
+so keeping connections alive avoids a fresh TLS handshake for every chart. Each host gets its own concurrency limit, so a large repo can't hammer a single origin.
+Responses are streamed straight to disk, and every request has a timeout.
+
+Downloads run on the scheduler's download lane, whose worker limit (LANE_DOWNLOAD_WORKERS) caps downloads in flight across all hosts.
+Downloads for a host at its limit wait in that host's queue rather than on a lane worker, so a slow host never holds up the others.
+
+:env DOWNLOAD_HOST_CONCURRENCY: Downloads in flight against any one host (default 4).
+:env DOWNLOAD_TIMEOUT: Connect and read timeout in seconds for chart downloads (default 60).
+"""
+
+import concurrent.futures
+import os
+import threading
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from helmScanner.scheduler import scheduler
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class ChartDownloader:
+
+    def __init__(self, hostConcurrency=None, timeout=None):
+        self.hostConcurrency = hostConcurrency or int(os.environ.get('DOWNLOAD_HOST_CONCURRENCY', default=4))
+        self.timeout = timeout or float(os.environ.get('DOWNLOAD_TIMEOUT', default=60))
+        self.lock = threading.Lock()
+        self.hosts = {}
+        # Per host: work running on the lane, and work waiting for the host to have a free slot.
+        self.active = defaultdict(int)
+        self.waiting = defaultdict(deque)
+
+    def _session(self, url):
+        """
+        :return session: The pooled session for the host serving url, created on first use.
+        """
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.hostConcurrency)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self.hosts[host] = session
+            return self.hosts[host]
+
+    def download(self, url, path):
+        """
+        Stream url to path. Host limits are applied by submit, so downloads should be run through it.
+
+        :return size: Bytes written.
+        :raises requests.exceptions.RequestException: On connection failure, timeout or HTTP error status.
+        """
+        session = self._session(url)
+        size = 0
+        with session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    size += len(chunk)
+        return size
+
+    def submit(self, url, func, *args):
+        """
+        Run func(*args) on the scheduler's download lane, counted against the concurrency limit of url's host.
+        If the host is at its limit, the work waits in the host's queue until one of its downloads finishes.
+
+        :return future: concurrent.futures.Future of the result.
+        """
+        host = urlparse(url).netloc
+        future = concurrent.futures.Future()
+        with self.lock:
+            if self.active[host] >= self.hostConcurrency:
+                self.waiting[host].append((future, func, args))
+                return future
+            self.active[host] += 1
+        scheduler.submit('download', self._run, host, future, func, args)
+        return future
+
+    def _run(self, host, future, func, args):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = func(*args)
+                except BaseException as err:
+                    future.set_exception(err)
+                else:
+                    future.set_result(result)
+        finally:
+            # Hand the host's slot straight to its next waiting download, if there is one.
+            with self.lock:
+                if self.waiting[host]:
+                    nextWork = self.waiting[host].popleft()
+                else:
+                    nextWork = None
+                    self.active[host] -= 1
+            if nextWork is not None:
+                scheduler.submit('download', self._run, host, *nextWork)
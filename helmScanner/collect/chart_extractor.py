@@ -0,0 +1,69 @@
+"""
+Chart Extractor
+===============
+
+Extracts chart archives in a single streaming pass, into a per-chart scratch directory that is removed as soon as the chart has been scanned.
+Every regular file is written, since templates can read any chart file through .Files.Get/.Files.Glob. Nested subchart archives (charts/*.tgz)
+are kept as they are, so helm and the dependency resolver still find them, and are also unpacked alongside where they were found.
+
+:env SCRATCH_PATH: Directory to create per-chart scratch directories in, e.g. /dev/shm to keep them on tmpfs (default: the system temp dir).
+"""
+
+import logging as helmscanner_logging
+import os
+import shutil
+import tarfile
+import tempfile
+
+ARCHIVE_SUFFIXES = ('.tgz', '.tar.gz', '.tar')
+
+
+def _target_path(extractPath, name):
+    """
+    :return path: Where an archive member belongs under extractPath, or None if its name is absolute or escapes extractPath.
+    """
+    name = os.path.normpath(name)
+    if os.path.isabs(name) or name == '..' or name.startswith('..' + os.sep):
+        return None
+    return os.path.join(extractPath, name)
+
+
+def extract_archive(fileobj, extractPath):
+    """
+    Stream a (possibly compressed) tar from fileobj into extractPath, also unpacking any nested archives alongside where they were found.
+
+    :return filesWritten: Number of files written, including those from nested archives.
+    """
+    filesWritten = 0
+    with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+        for member in tar:
+            target = _target_path(extractPath, member.name)
+            if target is None or not (member.isfile() or member.isdir()):
+                helmscanner_logging.debug(f"Skipping archive member {member.name}")
+                continue
+            if member.isdir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with tar.extractfile(member) as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            filesWritten += 1
+            if member.name.lower().endswith(ARCHIVE_SUFFIXES):
+                try:
+                    filesWritten += extract(target, os.path.dirname(target))
+                except tarfile.TarError:
+                    helmscanner_logging.warning(f"Could not unpack nested archive {member.name}, keeping it packaged")
+    return filesWritten
+
+
+def extract(archivePath, extractPath):
+    helmscanner_logging.debug(archivePath)
+    with open(archivePath, 'rb') as f:
+        return extract_archive(f, extractPath)
+
+
+def scratch_dir(prefix='chart-'):
+    """
+    :return: A tempfile.TemporaryDirectory under SCRATCH_PATH; used as a context manager, it gives the directory path and removes it on exit.
+    """
+    return tempfile.TemporaryDirectory(prefix=prefix, dir=os.environ.get('SCRATCH_PATH') or None)
@@ -0,0 +1,72 @@
+"""
+ArtifactHub Crawl Cache
+=======================
+
+Persists each repository's resolved package details between crawls, keyed on the repository `digest` ArtifactHub reports.
+While a repository's digest is unchanged, its package list and version details are served from the cache,
+and none of the per-package requests are made.
+
+:env CRAWL_CACHE_PATH: SQLite file holding the cache (default crawl-cache.sqlite in the helm-scanner cache dir). Set to an empty string to disable caching.
+"""
+
+import json
+import logging as helmscanner_logging
+import os
+import sqlite3
+import threading
+
+from helmScanner.scannerCache import cachePath
+
+
+class CrawlCache:
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS repositories (
+                    repository_id TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    last_tracking_ts INTEGER,
+                    packages TEXT NOT NULL
+                )""")
+
+    def get(self, repoResult):
+        """
+        :param repoResult: Repository result from the ArtifactHub repository search.
+        :return packages: The cached package details for this repository, or None if the repo is unknown or its digest has changed.
+        """
+        if not repoResult.get('digest'):
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT packages FROM repositories WHERE repository_id = ? AND digest = ?",
+                                  (repoResult['repository_id'], repoResult['digest'])).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, repoResult, packages):
+        """
+        Record the package details resolved for repoResult against its current digest, replacing any previous entry.
+        """
+        if not repoResult.get('digest'):
+            return
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO repositories (repository_id, digest, last_tracking_ts, packages) VALUES (?, ?, ?, ?)",
+                            (repoResult['repository_id'], repoResult['digest'], repoResult.get('last_tracking_ts'), json.dumps(packages)))
+
+
+def open_cache():
+    """
+    :return cache: CrawlCache at CRAWL_CACHE_PATH, or None if caching is disabled or the cache can't be opened.
+    """
+    path = os.environ.get('CRAWL_CACHE_PATH')
+    if path is None:
+        path = cachePath('crawl-cache.sqlite')
+    if not path:
+        return None
+    try:
+        return CrawlCache(path)
+    except sqlite3.Error as err:
+        helmscanner_logging.warning(f'Unable to open crawl cache at {path}, crawling without it: {err}')
+        return None
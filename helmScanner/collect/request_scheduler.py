@@ -0,0 +1,146 @@
+"""
+ArtifactHub Request Scheduler
+=============================
+
+Every ArtifactHub API call made by the crawler goes through one RequestScheduler, which:
+
+- Spaces requests with a token bucket, so the crawl never exceeds `rate` requests per second.
+- Retries 429s, transient 5xx responses and connection errors with jittered exponential backoff, honouring `Retry-After` when the API sends one.
+- Pauses all callers on a 429, rather than letting every worker find the limit on its own.
+- Adapts how many requests may be in flight: halved on every throttled response, and grown back by about one per window of successful ones, up to `maxConcurrency`.
+
+:env ARTIFACTHUB_RATE: Maximum ArtifactHub requests per second (default 20).
+:env ARTIFACTHUB_MAX_RETRIES: Retries for a throttled or failed request before giving up on it (default 5).
+"""
+
+import email.utils
+import logging as helmscanner_logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def retry_after_seconds(response):
+    """
+    :return seconds: The delay asked for by a response's Retry-After header (either delta-seconds or an HTTP date), or None if absent or unparseable.
+    """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retryAt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retryAt.tzinfo is None:
+        retryAt = retryAt.replace(tzinfo=timezone.utc)
+    return max((retryAt - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class RequestScheduler:
+
+    def __init__(self, session, maxConcurrency=16, rate=None, maxRetries=None, minConcurrency=1, backoffBase=1.0, backoffMax=60.0, timeout=30):
+        self.session = session
+        self.maxConcurrency = maxConcurrency
+        self.minConcurrency = minConcurrency
+        self.rate = rate or float(os.environ.get('ARTIFACTHUB_RATE', default=20))
+        self.maxRetries = maxRetries if maxRetries is not None else int(os.environ.get('ARTIFACTHUB_MAX_RETRIES', default=5))
+        self.backoffBase = backoffBase
+        self.backoffMax = backoffMax
+        self.timeout = timeout
+
+        self.condition = threading.Condition()
+        self.limit = float(maxConcurrency)
+        self.inFlight = 0
+        # The bucket holds up to one second's worth of requests.
+        self.capacity = max(self.rate, 1)
+        self.tokens = self.capacity
+        self.refilled = time.monotonic()
+        self.pausedUntil = 0.0
+
+    def _acquire(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now < self.pausedUntil:
+                    self.condition.wait(self.pausedUntil - now)
+                    continue
+                if self.inFlight >= int(self.limit):
+                    self.condition.wait()
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.refilled) * self.rate)
+                self.refilled = now
+                if self.tokens < 1:
+                    self.condition.wait((1 - self.tokens) / self.rate)
+                    continue
+                self.tokens -= 1
+                self.inFlight += 1
+                return
+
+    def _release(self, throttled=False, pause=0.0, succeeded=True):
+        # Only responses grow the limit; a request which failed outright leaves it as it was.
+        with self.condition:
+            self.inFlight -= 1
+            if throttled:
+                self.limit = max(self.minConcurrency, self.limit / 2)
+                self.pausedUntil = max(self.pausedUntil, time.monotonic() + pause)
+                helmscanner_logging.warning(f"ArtifactHub throttled us, pausing {pause:.1f}s and reducing concurrency to {int(self.limit)}")
+            elif succeeded:
+                self.limit = min(self.maxConcurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoffMax, self.backoffBase * 2 ** attempt))
+
+    def request(self, method, url, **kwargs):
+        """
+        Make a request through the scheduler, retrying it until it succeeds, fails with a non-retryable status, or runs out of retries.
+
+        :return response: The final response. Callers still need to check its status, since the last retry's response is returned as-is.
+        :raises requests.exceptions.RequestException: If the final attempt failed to get a response at all.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.maxRetries + 1):
+            lastAttempt = attempt == self.maxRetries
+            self._acquire()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                self._release(succeeded=False)
+                if lastAttempt:
+                    raise
+                delay = self._backoff(attempt)
+                helmscanner_logging.info(f"Retrying {url} in {delay:.1f}s after {err}")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                # Anything else isn't retried, but must still give back its slot.
+                self._release(succeeded=False)
+                raise
+            if response.status_code not in RETRY_STATUSES:
+                self._release()
+                return response
+            retryAfter = retry_after_seconds(response)
+            delay = retryAfter if retryAfter is not None else self._backoff(attempt)
+            if response.status_code == 429:
+                self._release(throttled=True, pause=delay)
+            else:
+                self._release()
+            if lastAttempt:
+                return response
+            # Discarded, so its connection goes back to the pool.
+            response.close()
+            helmscanner_logging.info(f"Retrying {url} in {delay:.1f}s after HTTP {response.status_code}")
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
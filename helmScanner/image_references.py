@@ -0,0 +1,130 @@
+"""
+Container Image References
+==========================
+
+Finds the container images a rendered chart uses by parsing its manifests, rather than grepping the text for `image:`.
+Every container, initContainer and ephemeralContainer image field is read, wherever the pod spec sits in the document,
+so Deployments, StatefulSets, DaemonSets, Jobs, CronJobs, Pods and pod-spec-shaped custom resources are all covered.
+
+References are normalized the way docker does, so registries with ports (registry:5000/app:1.2) and digests (app@sha256:...) are handled,
+and values which aren't valid image references are dropped instead of costing a failed docker pull.
+"""
+
+import logging as helmscanner_logging
+import re
+from collections import namedtuple
+
+import yaml
+
+CONTAINER_KEYS = ('containers', 'initContainers', 'ephemeralContainers')
+DEFAULT_REGISTRY = 'docker.io'
+DOCKER_HUB_ALIASES = ('docker.io', 'index.docker.io', 'registry-1.docker.io')
+
+REGISTRY_PATTERN = re.compile(r'^(localhost|[a-zA-Z0-9-]+(\.[a-zA-Z0-9-]+)*)(:[0-9]+)?$')
+REPOSITORY_PATTERN = re.compile(r'^[a-z0-9]+((\.|_|__|-+)[a-z0-9]+)*(/[a-z0-9]+((\.|_|__|-+)[a-z0-9]+)*)*$')
+TAG_PATTERN = re.compile(r'^[\w][\w.-]{0,127}$')
+DIGEST_PATTERN = re.compile(r'^[a-z0-9]+([+._-][a-z0-9]+)*:[a-fA-F0-9]{32,}$')
+
+
+class ImageReference(namedtuple('ImageReference', ['registry', 'repository', 'tag', 'digest'])):
+    """
+    A normalized image reference. registry and repository are always set; at least one of tag or digest is.
+    """
+    __slots__ = ()
+
+    @property
+    def familiar_name(self):
+        """
+        The image name as docker would display it, without the default registry or its library/ namespace.
+        """
+        if self.registry == DEFAULT_REGISTRY:
+            if self.repository.startswith('library/') and self.repository.count('/') == 1:
+                return self.repository[len('library/'):]
+            return self.repository
+        return f"{self.registry}/{self.repository}"
+
+    @property
+    def version(self):
+        """
+        The tag if there is one, otherwise the digest.
+        """
+        return self.tag or self.digest
+
+    def __str__(self):
+        reference = self.familiar_name
+        if self.tag:
+            reference += f":{self.tag}"
+        if self.digest:
+            reference += f"@{self.digest}"
+        return reference
+
+
+def parse_image_reference(value):
+    """
+    :param value: An image string from a manifest, e.g. nginx, bitnami/redis:6.2, registry:5000/team/app:1.2@sha256:...
+    :return reference: The normalized ImageReference, or None if value isn't a valid image reference.
+    """
+    if not isinstance(value, str):
+        return None
+    value = value.strip().strip('"\'')
+    if not value or any(c.isspace() for c in value):
+        return None
+    name, _, digest = value.partition('@')
+    tag = None
+    lastColon = name.rfind(':')
+    if lastColon > name.rfind('/'):
+        name, tag = name[:lastColon], name[lastColon + 1:]
+    registry, _, repository = name.partition('/')
+    if not repository or not ('.' in registry or ':' in registry or registry == 'localhost'):
+        registry, repository = DEFAULT_REGISTRY, name
+    if registry in DOCKER_HUB_ALIASES:
+        registry = DEFAULT_REGISTRY
+        if '/' not in repository:
+            repository = f"library/{repository}"
+    if not REGISTRY_PATTERN.match(registry) or not REPOSITORY_PATTERN.match(repository):
+        return None
+    if tag is not None and not TAG_PATTERN.match(tag):
+        return None
+    if digest and not DIGEST_PATTERN.match(digest):
+        return None
+    if not tag and not digest:
+        tag = 'latest'
+    return ImageReference(registry, repository, tag, digest or None)
+
+
+def _container_images(node):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in CONTAINER_KEYS and isinstance(value, list):
+                for container in value:
+                    if isinstance(container, dict) and 'image' in container:
+                        yield container['image']
+            yield from _container_images(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _container_images(item)
+
+
+def _documents(rendered):
+    # Parse documents one at a time, so one malformed document doesn't hide the images in the rest.
+    for document in re.split(r'^---\s*$', rendered, flags=re.MULTILINE):
+        try:
+            yield yaml.safe_load(document)
+        except yaml.YAMLError as err:
+            helmscanner_logging.debug(f"Skipping unparseable manifest document: {err}")
+
+
+def image_references(rendered):
+    """
+    :param rendered: Rendered manifests, as output by `helm template`.
+    :return imageList: Unique ImageReferences used by containers in the manifests, in the order first found.
+    """
+    imageList = {}
+    for document in _documents(rendered):
+        for image in _container_images(document):
+            reference = parse_image_reference(image)
+            if reference is None:
+                helmscanner_logging.info(f"Ignoring invalid image reference {image!r}")
+                continue
+            imageList.setdefault(reference, None)
+    return list(imageList)
@@ -2,7 +2,7 @@
 
 from sys import argv
 
-import csv
+import concurrent.futures
 import docker 
 import os
 import stat
@@ -12,8 +12,18 @@ from datetime import datetime, timedelta
 import subprocess  # nosec
 import json
 import logging as helmscanner_logging
-from slugify import slugify
-from helmScanner.multithreader import multithreadit
+import threading
+from collections import namedtuple
+try:
+    import ijson
+except ImportError:
+    ijson = None
+from helmScanner import image_store
+from helmScanner import vulnerability_cache
+from helmScanner.output import container_results
+from helmScanner.output.s3_uploader import uploadQueue
+from helmScanner.registry_client import RegistryClient
+from helmScanner.scheduler import scheduler
 from helmScanner.scannerTimeStamp import currentRunTimestamp
 
 # Get magic from checkov to build the headers
@@ -25,6 +35,10 @@ DOCKER_IMAGE_SCAN_RESULT_FILE_NAME = 'docker-image-scan-results.json'
 BC_API_URL = "https://www.bridgecrew.cloud/api/v1"
 BC_API_KEY = ""
 BC_SOURCE = "helm-scanner"
+VULNERABILITY_COLUMNS = ['CVE ID', 'Status', 'Severity', 'Package Name','Package Version','Link','CVSS','Vector','Description','Risk Factors','Publish Date','Is Remote Execution','Is Recent Vulnerability','CVE Has Fix']
+
+# Scan of one image, shared by every chart using it. Vulnerability rows are read back from the vulnerability cache by digest.
+ImageScanResult = namedtuple('ImageScanResult', ['image_id', 'digest', 'distribution'])
 
 
 class ImageScanner():
@@ -32,6 +46,15 @@ class ImageScanner():
         #super(ImageScanner, self).__init__()
         self.cmds = []
         self.cli = docker.from_env()
+        # Run-wide registries of image scans, so each image is scanned once however many charts use it.
+        self.registryLock = threading.Lock()
+        self.scansByReference = {}
+        self.scansByDigest = {}
+        self.vulnCache = vulnerability_cache.open_cache()
+        self.registryClient = RegistryClient()
+        self.resolvedDigests = {}
+        self.imageStore = image_store.open_store(self.cli)
+        self.containerResults = container_results.open_writer(VULNERABILITY_COLUMNS)
         docker_image_scanning_base_url = f"{BC_API_URL}/vulnerabilities/docker-images"
         self.docker_image_scanning_proxy_address=f"{docker_image_scanning_base_url}/twistcli/proxy"
         try:
@@ -43,26 +66,95 @@ class ImageScanner():
         pruned = self.cli.images.prune()
         helmscanner_logging.info(f"Pruned images: {pruned}")
 
-    def _scan_image(self, helmRepo, docker_image_id): 
+    def _claim(self, registry, key):
+        """
+        Look up key in one of the run-wide scan registries, registering a new in-flight scan if it isn't there.
+
+        :return future, owner: The Future of the scan result for key, and whether the caller is now responsible for completing it.
+        """
+        with self.registryLock:
+            future = registry.get(key)
+            if future is not None:
+                return future, False
+            future = registry[key] = concurrent.futures.Future()
+            return future, True
 
+    def _scan_image(self, helmRepo, image_reference): 
+        """
+        Scan an image for one chart. Each image is pulled and scanned at most once per run; other charts referencing it,
+        including while its scan is still in flight, wait for and reuse that result.
+        """
+        future, owner = self._claim(self.scansByReference, image_reference)
+        if owner:
+            try:
+                future.set_result(self._pull_and_scan(image_reference))
+            except Exception as e:
+                helmscanner_logging.error(f"Error scanning image {image_reference}. Exception is {e}")
+                future.set_result(None)
+        else:
+            helmscanner_logging.info(f"Image {image_reference} already scanned in this run, reusing results")
+        scan_result = future.result()
+        if scan_result is not None:
+            self.write_results(helmRepo, image_reference, scan_result)
+
+    def _pull_and_scan(self, image_reference):
+        """
+        :return scan_result: The ImageScanResult for image_reference, or None if it couldn't be pulled or scanned.
+        """
         docker_cli = docker.from_env()
+        docker_image_id = str(image_reference)
+        with self.registryLock:
+            digest = self.resolvedDigests.get(image_reference)
+        # Fall back to the digest this tag resolved to last time if the registry couldn't tell us.
+        digest = digest or image_reference.digest or self.vulnCache.digest_for(docker_image_id)
+        # A digest scanned within the cache TTL needs neither a pull nor a twistcli run.
+        cached = self._cached_result(digest)
+        if cached is not None:
+            helmscanner_logging.info(f"Using cached scan of {docker_image_id} ({cached.digest})")
+            return cached
+        # Different references (tags, digests, registry aliases) can resolve to the same image.
+        owned = None
+        if digest:
+            future, owner = self._claim(self.scansByDigest, digest)
+            if not owner:
+                helmscanner_logging.info(f"Image {docker_image_id} is {digest}, already scanned in this run")
+                return future.result()
+            owned = future
+        scan_result = None
         try:
-            img = docker_cli.images.get(docker_image_id)
-        except:
-            helmscanner_logging.info("Not found locally so pulling...")
-            try:
-                [image,tag]=docker_image_id.split(':')
-                helmscanner_logging.info("Pulling {0}:{1}".format(image,tag))
-                img = docker_cli.images.pull(image,tag)
-            except:
-                helmscanner_logging.info(f"Can't pull image {docker_image_id}")
-                return
-        # Create Dockerfile.  Only required for platform reporting
-        hist = img.history()
-        cmds = self._parse_history(hist)
-        cmds.reverse()
-        self._save_dockerfile(cmds, img)
+            pulled = scheduler.run('pull', self._pull, docker_cli, image_reference, digest)
+            if pulled is None:
+                return None
+            img, docker_image_id = pulled
+            if owned is None:
+                digest = self._image_digest(img, image_reference)
+                future, owner = self._claim(self.scansByDigest, digest)
+                if not owner:
+                    helmscanner_logging.info(f"Image {docker_image_id} is {digest}, already scanned in this run")
+                    return future.result()
+                owned = future
+                scan_result = self._cached_result(digest)
+                if scan_result is not None:
+                    helmscanner_logging.info(f"Using cached scan of {docker_image_id} ({digest})")
+                    return scan_result
+            self.vulnCache.remember(str(image_reference), digest)
+            scan_result = scheduler.run('twistcli', self._twistcli_scan, img, docker_image_id, digest)
+            return scan_result
+        finally:
+            # Whatever fails from the claim on, images waiting on this digest are released, with None if it wasn't scanned.
+            if owned is not None:
+                owned.set_result(scan_result)
+
+    def _twistcli_scan(self, img, docker_image_id, digest):
+        """
+        :return scan_result: ImageScanResult from running twistcli against a local image, or None if the scan failed.
+        """
         try:
+            # Create Dockerfile.  Only required for platform reporting
+            hist = img.history()
+            cmds = self._parse_history(hist)
+            cmds.reverse()
+            self._save_dockerfile(cmds, img)
             DOCKER_IMAGE_SCAN_RESULT_FILE_NAME = f".{img.id}.json"
             command_args = f"./{TWISTCLI_FILE_NAME} images scan --address {self.docker_image_scanning_proxy_address} --token {self.BC_API_KEY} --details --output-file {DOCKER_IMAGE_SCAN_RESULT_FILE_NAME} {docker_image_id}".split()
             helmscanner_logging.info("Running scan")
@@ -71,24 +163,91 @@ class ImageScanner():
             helmscanner_logging.info(f'TwistCLI ran successfully on image {docker_image_id}')
             # if twistcli worked our json file should be there
             if os.path.isfile(DOCKER_IMAGE_SCAN_RESULT_FILE_NAME):
-                with open(DOCKER_IMAGE_SCAN_RESULT_FILE_NAME) as docker_image_scan_result_file:
-                    self.parse_results(helmRepo, docker_image_id, img.id,json.load(docker_image_scan_result_file)) 
+                with open(DOCKER_IMAGE_SCAN_RESULT_FILE_NAME, 'rb') as docker_image_scan_result_file:
+                    scan_result = self.parse_results(img.id, digest, docker_image_scan_result_file)
                 os.remove(DOCKER_IMAGE_SCAN_RESULT_FILE_NAME)
-            docker_cli.images.remove(docker_image_id)
+                return scan_result
         except Exception as e:
             helmscanner_logging.error(f"Error running twistcli scan. Exception is {e}")
+        return None
 
+    def _pull(self, docker_cli, image_reference, digest=None):
+        """
+        Find an image locally, or pull it, by digest when one is known so the image scanned is exactly the one resolved.
 
-    def _scan_images(self, helmRepo, imageList): 
+        :return img, docker_image_id: The docker image and the reference it was found by, or None if it couldn't be pulled.
+        """
+        if digest and digest.startswith('sha256:'):
+            docker_image_id, pullVersion = f"{image_reference.familiar_name}@{digest}", digest
+        else:
+            docker_image_id, pullVersion = str(image_reference), image_reference.version
+        pulled = False
+        try:
+            img = docker_cli.images.get(docker_image_id)
+        except:
+            helmscanner_logging.info("Not found locally so pulling...")
+            try:
+                helmscanner_logging.info(f"Pulling {docker_image_id}")
+                img = docker_cli.images.pull(image_reference.familiar_name, pullVersion)
+                pulled = True
+            except:
+                helmscanner_logging.info(f"Can't pull image {docker_image_id}")
+                return None
+        # Pulled images stay in the image store, and are evicted least recently used first once over budget.
+        self.imageStore.track(img, image_reference, pulled)
+        return img, docker_image_id
+
+    def _cached_result(self, digest):
+        """
+        :return scan_result: ImageScanResult from the vulnerability cache, or None if digest is unknown or its scan has expired.
+        """
+        if not digest:
+            return None
+        cached = self.vulnCache.get(digest)
+        if cached is None:
+            return None
+        image_id, distribution = cached
+        return ImageScanResult(image_id, digest, distribution)
 
-        multithreadit(self._scan_image, helmRepo, imageList)
+    def _image_digest(self, img, image_reference):
+        """
+        :return digest: The manifest digest of a pulled image, preferring the one recorded for image_reference's repository, or the image id if docker has none.
+        """
+        if image_reference.digest:
+            return image_reference.digest
+        repoDigests = img.attrs.get('RepoDigests') or []
+        for repoDigest in repoDigests:
+            name, _, digest = repoDigest.partition('@')
+            if name == image_reference.familiar_name:
+                return digest
+        if repoDigests:
+            return repoDigests[0].partition('@')[2]
+        return img.id
+
+    def _scan_images(self, helmRepo, imageList): 
+        # Resolve tags to digests for the whole batch up front, so cache lookups and dedupe key on what each tag points at right now.
+        with self.registryLock:
+            unresolved = [image for image in imageList if image not in self.resolvedDigests]
+        resolved = self.registryClient.resolve_all(unresolved)
+        with self.registryLock:
+            self.resolvedDigests.update(resolved)
+        # Keep this chart's images pinned in the image store until they have all been scanned.
+        self.imageStore.pin(imageList)
+        try:
+            futures = [scheduler.submit('image', self._scan_image, helmRepo, image) for image in imageList]
+            for future in futures:
+                future.result()
+        finally:
+            self.imageStore.unpin(imageList)
         return
         
     def _save_dockerfile(self,cmds, img):
-        file = open(f"results/{currentRunTimestamp}/dockerfiles/{img.id}.Dockerfile","w")
+        filename = f"results/{currentRunTimestamp}/dockerfiles/{img.id}.Dockerfile"
+        file = open(filename,"w")
         for i in cmds:
             file.write(i)
         file.close()
+        uploadQueue.enqueue(filename)
 
     def _parse_history(self, hist, rec=False):
         first_tag = False
@@ -125,94 +284,111 @@ class ImageScanner():
         os.chmod(cli_file_name, st.st_mode | stat.S_IEXEC)
         helmscanner_logging.info(f'TwistCLI downloaded and has execute permission')
 
-    def parse_results(self, helmRepo, docker_image_name, image_id, twistcli_scan_result):
-        headerRow = ['Scan Timestamp','Helm Repo','Image Name','Image Tag','Image SHA','Total', 'Critical', 'High', 'Medium','Low']
-        filebase = slugify(f"{helmRepo}-{image_id[7:]}")
-        filenameVulns = f"results/{currentRunTimestamp}/containers/{filebase}.csv"
-        filenameSummary = f"results/{currentRunTimestamp}/container_summaries/{filebase}_summary.csv"
-        [imageName,imageTag] = docker_image_name.split(':')
-        # Create Summary
+    def parse_results(self, image_id, digest, twistcli_result_file):
+        """
+        Reduce a twistcli result file to the fields written out for each chart using the image, and store them in the vulnerability cache.
+        With ijson installed the file is parsed as a stream, one vulnerability at a time, rather than loaded whole.
+
+        :return scan_result: ImageScanResult for the image. Its vulnerability rows, in VULNERABILITY_COLUMNS order, are in the cache under digest.
+        """
+        if ijson is None:
+            result = json.load(twistcli_result_file)['results'][0]
+            distribution = result['vulnerabilityDistribution']
+            vulnerabilities = ()
+            if distribution['total'] > 0:
+                vulnerabilities = (self._vulnerability_row(x) for x in result['vulnerabilities'])
+        else:
+            # Filled in as the stream reaches it, which may be after the vulnerabilities; the cache reads it once they're stored.
+            distribution = {}
+            vulnerabilities = self._stream_vulnerabilities(twistcli_result_file, distribution)
+        self.vulnCache.put(digest, image_id, distribution, vulnerabilities)
+        return ImageScanResult(image_id, digest, distribution)
+
+    def _stream_vulnerabilities(self, twistcli_result_file, distribution):
+        """
+        Generator of vulnerability rows for the first result in a twistcli result file, each decoded and reduced as it's reached.
+        The result's vulnerabilityDistribution is copied into distribution.
+        """
+        results = 0
+        builder = builderPrefix = None
+        for prefix, event, value in ijson.parse(twistcli_result_file, use_float=True):
+            if prefix == 'results.item' and event == 'start_map':
+                results += 1
+                if results > 1:
+                    break
+            if builder is None:
+                if event != 'start_map' or prefix not in ('results.item.vulnerabilities.item', 'results.item.vulnerabilityDistribution'):
+                    continue
+                builder, builderPrefix = ijson.ObjectBuilder(), prefix
+            builder.event(event, value)
+            if event == 'end_map' and prefix == builderPrefix:
+                if builderPrefix == 'results.item.vulnerabilityDistribution':
+                    distribution.update(builder.value)
+                else:
+                    yield self._vulnerability_row(builder.value)
+                builder = None
+        if not distribution:
+            # Raised while the cache is storing the rows, so none of them are kept.
+            raise ValueError('twistcli result has no vulnerabilityDistribution')
+
+    def _vulnerability_row(self, x):
         try:
-            with open(filenameSummary, 'w') as f: 
-                write = csv.writer(f) 
-                write.writerow(headerRow) 
-                row = [
-                    currentRunTimestamp,
-                    helmRepo,
-                    imageName,
-                    imageTag,
-                    image_id,
-                    twistcli_scan_result['results'][0]['vulnerabilityDistribution']['total'],
-                    twistcli_scan_result['results'][0]['vulnerabilityDistribution']['critical'],
-                    twistcli_scan_result['results'][0]['vulnerabilityDistribution']['high'],
-                    twistcli_scan_result['results'][0]['vulnerabilityDistribution']['medium'],
-                    twistcli_scan_result['results'][0]['vulnerabilityDistribution']['low'] ]
-                write.writerow(row) 
-        except Exception as e: 
-            helmscanner_logging.info("*****IMAGE SCANNING - ERROR OPENING CSV OCCURED *****")
-            print(e)
-        # Create Vulns Doc (if required)
-        if twistcli_scan_result['results'][0]['vulnerabilityDistribution']['total'] > 0:
-            headerRow = ['Scan Timestamp','Helm Repo','Image Name','Image Tag','Image SHA','CVE ID', 'Status', 'Severity', 'Package Name','Package Version','Link','CVSS','Vector','Description','Risk Factors','Publish Date','Is Remote Execution','Is Recent Vulnerability','CVE Has Fix']           
-            with open(filenameVulns, 'w') as f: 
-                write = csv.writer(f) 
-                write.writerow(headerRow) 
-                for x in twistcli_scan_result['results'][0]['vulnerabilities']:
-                    try:
-                        link = x['link']
-                    except:
-                        link = ''
-                    riskFactorRemoteExecution = 0
-                    riskFactorHasFix = 0 
-                    riskFactorRecentVuln = 0 
-                    if "remote execution" in x.get('riskFactors'):
-                        riskFactorRemoteExecution = 1
-                    if "Recent vulnerability" in x.get('riskFactors'):
-                        riskFactorRecentVuln = 1
-                    if "has fix" in x.get('riskFactors'):
-                        riskFactorHasFix = 1
-
-                    # We already have this data elsewhere in the CSV row.
-                    # riskFactorsAttackVector = list(filter(lambda x: x.startswith("Attack vector:"), x.get('riskFactors')))
-                    # if len(riskFactorsAttackVector) > 0:
-                    #     riskFactorsAttackVector = riskFactorsAttackVector[0].split(":")[1]
-                    # else:
-                    #     riskFactorsAttackVector = "unknown"
-
-                    # riskFactorSeverity = list(filter(lambda x: x.contains("severity"), x.get('riskFactors')))
-                    # if riskFactorSeverity.startswith("High"):
-                    #     riskFactorSeverity = "High"
-                    # if riskFactorSeverity.startswith("Medium"):
-                    #     riskFactorSeverity = "Medium"
-                    # if riskFactorSeverity.startswith("Low"):
-                    #     riskFactorSeverity = "Low"
-                    # else:
-                    #     riskFactorSeverity = "unknown"
-                        
-
-                
-                    row = [
-                        currentRunTimestamp,
-                        helmRepo,
-                        imageName,
-                        imageTag,
-                        image_id,
-                        x['id'],
-                        x.get('status', 'open'),
-                        x['severity'],
-                        x['packageName'],
-                        x['packageVersion'],
-                        link,
-                        x.get('cvss'),
-                        x.get('vector'),
-                        x.get('description'),
-                        x.get('riskFactors'),
-                        (datetime.now() - timedelta(days=x.get('publishedDays', 0))).isoformat(),
-                        riskFactorRemoteExecution,
-                        riskFactorRecentVuln,
-                        riskFactorHasFix ] 
-                    write.writerow(row) 
-
-
-
-imageScanner = ImageScanner()
+            link = x['link']
+        except:
+            link = ''
+        riskFactorRemoteExecution = 0
+        riskFactorHasFix = 0 
+        riskFactorRecentVuln = 0 
+        if "remote execution" in x.get('riskFactors'):
+            riskFactorRemoteExecution = 1
+        if "Recent vulnerability" in x.get('riskFactors'):
+            riskFactorRecentVuln = 1
+        if "has fix" in x.get('riskFactors'):
+            riskFactorHasFix = 1
+
+        # We already have this data elsewhere in the CSV row.
+        # riskFactorsAttackVector = list(filter(lambda x: x.startswith("Attack vector:"), x.get('riskFactors')))
+        # if len(riskFactorsAttackVector) > 0:
+        #     riskFactorsAttackVector = riskFactorsAttackVector[0].split(":")[1]
+        # else:
+        #     riskFactorsAttackVector = "unknown"
+
+        # riskFactorSeverity = list(filter(lambda x: x.contains("severity"), x.get('riskFactors')))
+        # if riskFactorSeverity.startswith("High"):
+        #     riskFactorSeverity = "High"
+        # if riskFactorSeverity.startswith("Medium"):
+        #     riskFactorSeverity = "Medium"
+        # if riskFactorSeverity.startswith("Low"):
+        #     riskFactorSeverity = "Low"
+        # else:
+        #     riskFactorSeverity = "unknown"
+
+        return (
+            x['id'],
+            x.get('status', 'open'),
+            x['severity'],
+            x['packageName'],
+            x['packageVersion'],
+            link,
+            x.get('cvss'),
+            x.get('vector'),
+            x.get('description'),
+            x.get('riskFactors'),
+            (datetime.now() - timedelta(days=x.get('publishedDays', 0))).isoformat(),
+            riskFactorRemoteExecution,
+            riskFactorRecentVuln,
+            riskFactorHasFix )
+
+    def write_results(self, helmRepo, image_reference, scan_result):
+        # Rows go to the run's rolling container results files; vulnerability rows are read from the cache by the writer thread.
+        imageColumns = [currentRunTimestamp, helmRepo, image_reference.familiar_name, image_reference.version, scan_result.image_id]
+        summaryRow = imageColumns + [
+            scan_result.distribution['total'],
+            scan_result.distribution['critical'],
+            scan_result.distribution['high'],
+            scan_result.distribution['medium'],
+            scan_result.distribution['low'] ]
+        vulnerabilityRows = (imageColumns + list(vulnerability) for vulnerability in self.vulnCache.vulnerabilities(scan_result.digest))
+        self.containerResults.put(summaryRow, vulnerabilityRows)
+
+
@@ -0,0 +1,116 @@
+"""
+Docker Image Store
+==================
+
+Keeps pulled images around under a disk budget instead of removing each one straight after its scan, so base layers shared by many images stay warm across charts.
+When docker's layer storage goes over budget, the least recently used images this store pulled are removed first; images that were already
+on the host are left alone. Usage is measured with `docker system df` at most once a minute while under budget, and again after each removal.
+Images referenced by a chart whose images are still queued for scanning are pinned and never evicted.
+
+:env IMAGE_STORE_MAX_BYTES: Disk budget for pulled images in bytes (default 20GiB).
+"""
+
+import logging as helmscanner_logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+
+class ImageStore:
+
+    def __init__(self, docker_cli, maxBytes, measureInterval=60):
+        self.docker_cli = docker_cli
+        self.maxBytes = maxBytes
+        self.measureInterval = measureInterval
+        self.lock = threading.Lock()
+        # Only one thread measures and evicts at a time; the others carry on with their scans.
+        self.evictLock = threading.Lock()
+        self.pins = Counter()
+        # image id -> [size, set of ImageReferences it was used for], least recently used first.
+        # Only images this store pulled are tracked, so images already on the host are never evicted.
+        self.images = OrderedDict()
+        # Layer storage as last measured, plus the sizes of images pulled since. Measured again once stale or over budget.
+        self.usage = None
+        self.measuredAt = 0
+
+    def pin(self, imageList):
+        with self.lock:
+            self.pins.update(imageList)
+
+    def unpin(self, imageList):
+        with self.lock:
+            self.pins.subtract(imageList)
+            self.pins += Counter()
+        self._evict()
+
+    def track(self, img, image_reference, pulled=True):
+        """
+        Record that img was just used for image_reference, making it the most recently used image, and evict others if over budget.
+
+        :param pulled: Whether img was just pulled. Images found locally are only tracked if this store pulled them earlier.
+        """
+        with self.lock:
+            entry = self.images.get(img.id)
+            if entry is None:
+                if not pulled:
+                    return
+                entry = self.images[img.id] = [img.attrs.get('Size', 0), set()]
+                if self.usage is not None:
+                    self.usage += entry[0]
+            entry[1].add(image_reference)
+            self.images.move_to_end(img.id)
+        self._evict()
+
+    def _measure(self):
+        # Layers shared between images are only counted once by docker's own accounting.
+        try:
+            usage = self.docker_cli.df().get('LayersSize', 0)
+        except Exception:
+            with self.lock:
+                usage = sum(size for size, references in self.images.values())
+        with self.lock:
+            self.usage, self.measuredAt = usage, time.monotonic()
+        return usage
+
+    def _next_victim(self):
+        """
+        :return image_id: The least recently used unpinned image, now untracked, or None if every tracked image is pinned.
+        """
+        with self.lock:
+            for image_id, (size, references) in self.images.items():
+                if not any(self.pins[reference] for reference in references):
+                    del self.images[image_id]
+                    return image_id
+        return None
+
+    def _evict(self):
+        if not self.evictLock.acquire(blocking=False):
+            return
+        try:
+            with self.lock:
+                usage = self.usage
+                stale = time.monotonic() - self.measuredAt > self.measureInterval
+            if usage is None or stale or usage > self.maxBytes:
+                usage = self._measure()
+            while usage > self.maxBytes:
+                image_id = self._next_victim()
+                if image_id is None:
+                    return
+                try:
+                    # Not forced, so an image a container is using, or that is also tagged by someone else, stays put.
+                    self.docker_cli.images.remove(image_id)
+                    helmscanner_logging.info(f"Evicted image {image_id} from the image store")
+                except Exception as e:
+                    helmscanner_logging.info(f"Unable to evict image {image_id}, leaving it to docker: {e}")
+                # Shared layers make an image's own size a poor guide to what removing it freed, so measure again.
+                usage = self._measure()
+        finally:
+            self.evictLock.release()
+
+
+def open_store(docker_cli):
+    """
+    :return store: ImageStore over docker_cli with an IMAGE_STORE_MAX_BYTES budget.
+    """
+    return ImageStore(docker_cli, int(os.environ.get('IMAGE_STORE_MAX_BYTES', default=20 * 1024 ** 3)))
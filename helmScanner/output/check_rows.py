@@ -0,0 +1,86 @@
+"""
+Checkov Check Rows
+==================
+
+Turns a chart's Checkov results into rows of the checks table in bulk.
+
+Per-check work is kept to lookups: check categories come from an index of the checkov helm registry built once,
+resource names are parsed with a precompiled expression and memoized (the same resources recur across copies of a chart),
+and each chart's repository and package columns are stored once and shared by all of its rows (see row_store).
+"""
+
+import functools
+import re
+import threading
+
+from helmScanner.scannerTimeStamp import currentRunTimestamp
+
+# Group 3 of the resource id is the helm chart name reported in the checks table.
+RESOURCE_NAME_EXPRESSION = re.compile(r'(.*)\.(RELEASE-NAME-)?(.*)(\.default)?')
+RESOURCE_NAME_GROUP = 3
+
+_categoryIndex = None
+_categoryIndexLock = threading.Lock()
+
+
+def _category_index():
+    global _categoryIndex
+    with _categoryIndexLock:
+        if _categoryIndex is None:
+            from checkov.helm.registry import registry
+            # lstrip (rather than removing the prefix) matches the categories in previously published results.
+            _categoryIndex = {check.id: str(check.categories[0]).lstrip("CheckCategories.")
+                              for checks in registry.checks.values() for check in checks}
+    return _categoryIndex
+
+
+def check_category(check_id):
+    """
+    :return category: The check's first category as it appears in the checks table, "None" for checks the helm registry doesn't know.
+    """
+    index = _categoryIndex if _categoryIndex is not None else _category_index()
+    return index.get(check_id, "None")
+
+
+@functools.lru_cache(maxsize=65536)
+def helm_chart_name(resource):
+    return RESOURCE_NAME_EXPRESSION.search(resource).group(RESOURCE_NAME_GROUP)
+
+
+def chart_meta(repo, chartPackage, repoChartPathName):
+    """
+    :return meta: The chart's values for the checks table's meta columns (row_store.CHECK_META_COLUMNS).
+    """
+    return (
+        currentRunTimestamp,
+        repoChartPathName,
+        repo['repoName'],
+        chartPackage['name'],
+        chartPackage['version'],
+        chartPackage['ts'],
+        chartPackage.get('signed', 'no data'),
+        chartPackage.get('security_report_created_at', 'no data'),
+        chartPackage.get('is_operator', 'no data'),
+        repo['repoRaw']['repository_id'],
+        repo['repoRaw']['digest'],
+        repo['repoRaw']['last_tracking_ts'],
+        repo['repoRaw']['verified_publisher'],
+        repo['repoRaw']['official'],
+        repo['repoRaw']['scanner_disabled'],
+    )
+
+
+def add_check_rows(store, metaId, results):
+    """
+    Add a chart's checks to the checks table: its passed checks, then its failed checks, or a single "empty scan" row if Checkov found nothing to check.
+
+    :param store: The organisation's checks table (row_store.check_store).
+    :param metaId: The chart's meta id in store, from chart_meta.
+    :param results: Checkov results from checkov_worker.scan_manifests (or the Checkov result cache).
+    """
+    for checks in (results["passed"], results["failed"]):
+        for check in checks:
+            resource = check[5]
+            store.append(metaId, (helm_chart_name(resource), check_category(check[0]), *check[:5], resource.split(".")[0]))
+    if results["empty"]:
+        store.append(metaId, ("empty scan",) * 8)
@@ -0,0 +1,129 @@
+"""
+Container Results Writer
+========================
+
+Writes every image's summary and vulnerability rows to a few rolling run-level CSV files, rather than two small files per image per chart.
+Image scans hand their rows to a queue, and a single writer thread appends each image's rows to the current files in one write.
+Files are written as .csv.partial and, once they reach CONTAINER_RESULTS_MAX_MB or the run ends, renamed and queued for upload.
+
+Summaries go to container_summaries/container-summaries-<n>.csv and vulnerabilities to containers/container-vulnerabilities-<n>.csv.
+
+:env CONTAINER_RESULTS_MAX_MB: Size at which a container results file is closed and a new one started (default 256).
+"""
+
+import csv
+import io
+import logging as helmscanner_logging
+import os
+import queue
+import threading
+
+from helmScanner.output.s3_uploader import uploadQueue
+from helmScanner.scannerTimeStamp import currentRunTimestamp
+
+IMAGE_COLUMNS = ['Scan Timestamp', 'Helm Repo', 'Image Name', 'Image Tag', 'Image SHA']
+SUMMARY_COLUMNS = IMAGE_COLUMNS + ['Total', 'Critical', 'High', 'Medium', 'Low']
+
+_CLOSE = object()
+
+
+def _csv_text(rows):
+    text = io.StringIO()
+    csv.writer(text).writerows(rows)
+    return text.getvalue()
+
+
+class RollingCsv:
+
+    def __init__(self, directory, name, header, maxBytes):
+        self.directory = directory
+        self.name = name
+        self.header = header
+        self.maxBytes = maxBytes
+        self.index = 0
+        self.file = None
+
+    def _path(self):
+        return f"{self.directory}/{self.name}-{self.index:04d}.csv"
+
+    def write(self, text):
+        """
+        Append text, an image's rows already formatted by _csv_text, in a single write.
+        """
+        if self.file is None:
+            self.index += 1
+            os.makedirs(self.directory, exist_ok=True)
+            self.file = open(f"{self._path()}.partial", 'w', newline='', buffering=1024 * 1024)
+            self.file.write(_csv_text([self.header]))
+        self.file.write(text)
+        if self.file.tell() >= self.maxBytes:
+            self.close()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        os.rename(f"{self._path()}.partial", self._path())
+        uploadQueue.enqueue(self._path())
+
+
+class ContainerResultsWriter:
+
+    def __init__(self, resultsPath, vulnerabilityColumns, maxBytes):
+        self.summaries = RollingCsv(f"{resultsPath}/container_summaries", 'container-summaries', SUMMARY_COLUMNS, maxBytes)
+        self.vulnerabilities = RollingCsv(f"{resultsPath}/containers", 'container-vulnerabilities', IMAGE_COLUMNS + vulnerabilityColumns, maxBytes)
+        self.queue = queue.Queue(maxsize=1024)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def put(self, summaryRow, vulnerabilityRows):
+        """
+        Queue an image's rows to be written.
+
+        :param summaryRow: The image's container summary row.
+        :param vulnerabilityRows: Iterable of its vulnerability rows, only iterated by the writer thread.
+        """
+        # The writer thread is started on first use, so runs without image scans never start it.
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._write, name='container-results', daemon=True)
+                self.thread.start()
+        self.queue.put((summaryRow, vulnerabilityRows))
+
+    def _write(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _CLOSE:
+                    break
+                summaryRow, vulnerabilityRows = item
+                try:
+                    # Each image's rows are formatted in full before any are written, so a failure part way through leaves none of them in the files.
+                    # Its summary is written last, so a summary row always has all of its image's vulnerabilities.
+                    vulnerabilityText = _csv_text(vulnerabilityRows)
+                    summaryText = _csv_text([summaryRow])
+                    self.vulnerabilities.write(vulnerabilityText)
+                    self.summaries.write(summaryText)
+                except Exception as e:
+                    helmscanner_logging.error(f"Failed to write container results for {summaryRow[2]}:{summaryRow[3]}: {e}")
+        finally:
+            self.summaries.close()
+            self.vulnerabilities.close()
+
+    def close(self):
+        """
+        Write everything queued, then close and upload the current files.
+        """
+        with self.lock:
+            thread = self.thread
+        # A writer thread that has stopped has already closed its files.
+        if thread is None or not thread.is_alive():
+            return
+        self.queue.put(_CLOSE)
+        thread.join()
+
+
+def open_writer(vulnerabilityColumns):
+    maxBytes = int(os.environ.get('CONTAINER_RESULTS_MAX_MB', default=256)) * 1024 * 1024
+    return ContainerResultsWriter(f"results/{currentRunTimestamp}", vulnerabilityColumns, maxBytes)
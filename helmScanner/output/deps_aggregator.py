@@ -0,0 +1,70 @@
+"""
+Global Dependency Tables
+========================
+
+Aggregates every organisation's chart dependencies into run-wide tables as the run goes:
+global-deps-table.csv counts how many charts use each dependency, and global-deps-list.csv lists the charts using each one.
+
+Organisations are merged as they finish, from any thread. The tables are written when the run ends, and checkpointed
+at most every DEPS_CHECKPOINT_SECONDS in between, rather than rewritten by every organisation.
+
+:env DEPS_CHECKPOINT_SECONDS: Minimum time between checkpoints of the global tables during the run (default 300, 0 to only write them at the end).
+"""
+
+import logging as helmscanner_logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+
+class DepsAggregator:
+
+    def __init__(self, path, checkpointSeconds):
+        self.path = path
+        self.checkpointSeconds = checkpointSeconds
+        self.lock = threading.Lock()
+        self.writeLock = threading.Lock()
+        self.usage = Counter()
+        self.dependants = defaultdict(set)
+        self.lastWrite = time.monotonic()
+
+    def add(self, depsTable):
+        """
+        Merge an organisation's deps table (row_store.dep_store) into the run's tables, checkpointing them if they're due.
+
+        :return paths: The files written by a checkpoint, if there was one.
+        """
+        chartColumn = depsTable.columns.index('combined name')
+        depColumn = depsTable.columns.index('dep helm chart')
+        with self.lock:
+            for row in depsTable.rows():
+                self.usage[row[depColumn]] += 1
+                self.dependants[row[depColumn]].add(row[chartColumn])
+            due = self.checkpointSeconds and time.monotonic() - self.lastWrite >= self.checkpointSeconds
+            if due:
+                self.lastWrite = time.monotonic()
+        return self.write() if due else []
+
+    def write(self):
+        """
+        Write the global tables as they stand.
+
+        :return paths: The files written.
+        """
+        # One writer at a time, so an older snapshot never overwrites a newer one.
+        with self.writeLock:
+            with self.lock:
+                usage = dict(self.usage)
+                dependants = {dep: sorted(charts) for dep, charts in self.dependants.items()}
+            helmscanner_logging.info(f"Writing global deps tables for {len(usage)} dependencies")
+            paths = [f'{self.path}/global-deps-table.csv', f'{self.path}/global-deps-list.csv']
+            pd.DataFrame.from_dict(usage, orient='index', columns=['charts']).to_csv(paths[0])
+            pd.DataFrame.from_dict(dependants, orient='index').transpose().to_csv(paths[1])
+        return paths
+
+
+def open_aggregator(path):
+    return DepsAggregator(path, float(os.environ.get('DEPS_CHECKPOINT_SECONDS', default=300)))
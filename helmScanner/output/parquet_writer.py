@@ -0,0 +1,133 @@
+"""
+Parquet Output
+==============
+
+Writes the checks, summary and deps tables as Parquet, alongside or instead of the per-organisation CSVs.
+Each table is a single run-level file (results/<time>/parquet/<table>.parquet) with one row group per organisation.
+Repeated text columns are dictionary encoded, ArtifactHub timestamps are typed timestamps and its flags are booleans,
+with non-values such as "no data" stored as nulls.
+
+Files are written as <table>.parquet.partial and renamed when the run closes them, so partial uploads never pick up a file without its footer.
+pyarrow is optional; without it only CSV output is available.
+
+:env OUTPUT_FORMAT: csv (default), parquet or both.
+"""
+
+import logging as helmscanner_logging
+import os
+import threading
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+TIMESTAMP_COLUMNS = {'runner timestamp', 'package created at', 'security report created timestamp', 'repository tracking ts'}
+BOOLEAN_COLUMNS = {'package is signed', 'resource is operator', 'repository verified', 'repository official', 'repository scanning disbled'}
+INTEGER_COLUMNS = {'passed checks', 'failed checks', 'parsing errors'}
+
+
+def output_formats():
+    """
+    :return csv, parquet: Whether each output format is enabled by OUTPUT_FORMAT.
+    """
+    outputFormat = os.environ.get('OUTPUT_FORMAT', 'csv').lower()
+    if outputFormat not in ('csv', 'parquet', 'both'):
+        helmscanner_logging.warning(f'Unknown OUTPUT_FORMAT {outputFormat}, writing csv')
+        outputFormat = 'csv'
+    if outputFormat != 'csv' and pa is None:
+        helmscanner_logging.warning('OUTPUT_FORMAT includes parquet but pyarrow is not installed, writing csv')
+        outputFormat = 'csv'
+    return outputFormat in ('csv', 'both'), outputFormat in ('parquet', 'both')
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S")
+        except ValueError:
+            return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.utcfromtimestamp(value)
+    return None
+
+
+def _boolean(value):
+    return value if isinstance(value, bool) else None
+
+
+def _integer(value):
+    return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+
+def _string(value):
+    return None if value is None else str(value)
+
+
+def _column_type(column):
+    """
+    :return type, convert: The Parquet type of column and the function converting its values.
+    """
+    if column in TIMESTAMP_COLUMNS:
+        return pa.timestamp('s'), _timestamp
+    if column in BOOLEAN_COLUMNS:
+        return pa.bool_(), _boolean
+    if column in INTEGER_COLUMNS:
+        return pa.int64(), _integer
+    return pa.dictionary(pa.int32(), pa.string()), _string
+
+
+def _arrow_column(store, column, columnType, convert):
+    if column in store.metaColumns:
+        index = store.metaColumns.index(column)
+        # Convert each chart's value once, then repeat it for the chart's rows.
+        metaValues = [convert(meta[index]) for meta in store.metas]
+        values = [metaValues[metaId] for metaId in store.rowMetas]
+    else:
+        values = [convert(value) for value in store.values[store.valueColumns.index(column)]]
+    if pa.types.is_dictionary(columnType):
+        return pa.array(values, pa.string()).dictionary_encode()
+    return pa.array(values, columnType)
+
+
+class ParquetSink:
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.writers = {}
+
+    def write(self, table, store):
+        """
+        Append store's rows to the run's table as one row group.
+
+        :param table: Table name, used for the file name.
+        :param store: The organisation's row_store.RowStore for table.
+        """
+        if not len(store):
+            return
+        types = [_column_type(column) for column in store.columns]
+        schema = pa.schema([(column, columnType) for column, (columnType, _) in zip(store.columns, types)])
+        arrowTable = pa.Table.from_arrays([_arrow_column(store, column, columnType, convert)
+                                           for column, (columnType, convert) in zip(store.columns, types)], schema=schema)
+        with self.lock:
+            writer = self.writers.get(table)
+            if writer is None:
+                os.makedirs(self.path, exist_ok=True)
+                writer = self.writers[table] = pq.ParquetWriter(f"{self.path}/{table}.parquet.partial", schema, compression='zstd')
+            writer.write_table(arrowTable)
+
+    def close(self):
+        """
+        :return paths: The completed Parquet files.
+        """
+        paths = []
+        with self.lock:
+            for table, writer in self.writers.items():
+                writer.close()
+                os.rename(f"{self.path}/{table}.parquet.partial", f"{self.path}/{table}.parquet")
+                paths.append(f"{self.path}/{table}.parquet")
+            self.writers = {}
+        return paths
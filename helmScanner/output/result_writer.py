@@ -1,18 +1,21 @@
-import pandas as pd
+def print_parquet(sink, sum_table, chk_table, helmdeps_lst):
+    # Append this org's tables to the run's parquet files.
+    sink.write('checks', chk_table)
+    sink.write('summaries', sum_table)
+    sink.write('deps', helmdeps_lst)
 
-def print_csv(sum_table, chk_table, helmdeps_lst, empty_resources, path, repo, orgRepoFilename, globaldepslist, globaldepsusage):
+def print_csv(sum_table, chk_table, helmdeps_lst, empty_resources, path, repo, orgRepoFilename):
+    # Returns the files written, for upload.
     # create checks table:
-    checks_frame = pd.DataFrame(chk_table, columns=[ 'runner timestamp', 'combined name', "repository name", "package name", "package latest version",
-                                                    'package created at', 'package is signed', 'security report created timestamp', 'helm chart', 'resource is operator',
-                                                    'check catagory', 'check id', 'check name', 'check result', 'file path', "check class", "resource id", "repository id", "repository digest", "repository tracking ts", "repository verified", "repository official", "repository scanning disbled" ])
-    checks_frame.to_csv(f'{path}/checks/checks-table-{orgRepoFilename}.csv')
+    checks_frame = chk_table.frame()
+    checks_path = f'{path}/checks/checks-table-{orgRepoFilename}.csv'
+    checks_frame.to_csv(checks_path)
     
 
     # create summary table:
-    summary_frame = pd.DataFrame(sum_table, columns=[ 'runner timestamp', 'combined name', "repository name", "package name", "package latest version",
-                                                     'package created at', 'package is signed', 'security report created timestamp', 'helm chart', 'resource is operator', 'scan status', 
-                                                     'passed checks', 'failed checks', 'parsing errors' ])
-    summary_frame.to_csv(f'{path}/summaries/summarytable-{orgRepoFilename}.csv')
+    summary_frame = sum_table.frame()
+    summary_path = f'{path}/summaries/summarytable-{orgRepoFilename}.csv'
+    summary_frame.to_csv(summary_path)
 
 
     # Chart Deps
@@ -27,14 +30,8 @@ def print_csv(sum_table, chk_table, helmdeps_lst, empty_resources, path, repo, o
                 #             current_dep.values()[3]  #dep dict chart_status
                 #         ]
 
-    chart_deps_frame = pd.DataFrame(helmdeps_lst, columns=[ 'runner timestamp', 'combined name', "repository name", "package name", "package latest version",
-                                                     'dep helm chart', 'dep helm version', 'dep repo', 'dep chart status' ])
-    chart_deps_frame.to_csv(f'{path}/deps/deps-table-{orgRepoFilename}.csv')
+    chart_deps_frame = helmdeps_lst.frame()
+    chart_deps_path = f'{path}/deps/deps-table-{orgRepoFilename}.csv'
+    chart_deps_frame.to_csv(chart_deps_path)
 
-    # Global deps statistics
-    global_deps_stats = pd.DataFrame.from_dict(globaldepsusage, orient='index')
-    global_deps_stats.to_csv(f'{path}/global-deps-table.csv')
-
-    global_deps_list = pd.DataFrame.from_dict(globaldepslist, orient='index')
-    global_deps_list = global_deps_list.transpose()
-    global_deps_list.to_csv(f'{path}/global-deps-list.csv')
\ No newline at end of file
+    return [checks_path, summary_path, chart_deps_path]
@@ -0,0 +1,97 @@
+"""
+Row Store
+=========
+
+Compact, column oriented storage for the checks, summary and deps tables while an organisation is scanned.
+
+Columns that are the same for every row of a chart (run timestamp, repository and package details) are held once per chart
+as a meta tuple, and rows refer to it by id. Every other column is kept as its own list, with repeated strings interned,
+so a row costs a few pointers rather than a list of copied values. Tables become DataFrames only when they're written.
+"""
+
+import sys
+from array import array
+
+import pandas as pd
+
+CHART_COLUMNS = ['runner timestamp', 'combined name', "repository name", "package name", "package latest version"]
+PACKAGE_COLUMNS = ['package created at', 'package is signed', 'security report created timestamp']
+REPOSITORY_COLUMNS = ["repository id", "repository digest", "repository tracking ts", "repository verified", "repository official", "repository scanning disbled"]
+
+CHECK_COLUMNS = CHART_COLUMNS + PACKAGE_COLUMNS + ['helm chart', 'resource is operator', 'check catagory', 'check id', 'check name', 'check result',
+                                                  'file path', "check class", "resource id"] + REPOSITORY_COLUMNS
+CHECK_META_COLUMNS = CHART_COLUMNS + PACKAGE_COLUMNS + ['resource is operator'] + REPOSITORY_COLUMNS
+
+SUMMARY_COLUMNS = CHART_COLUMNS + PACKAGE_COLUMNS + ['helm chart', 'resource is operator', 'scan status', 'passed checks', 'failed checks', 'parsing errors']
+
+DEP_COLUMNS = CHART_COLUMNS + ['dep helm chart', 'dep helm version', 'dep repo', 'dep chart status']
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class RowStore:
+
+    def __init__(self, columns, metaColumns=()):
+        """
+        :param columns: The table's columns, in order.
+        :param metaColumns: Columns whose values are given per chart with meta() rather than per row; the rest are given to append() in table order.
+        """
+        self.columns = list(columns)
+        self.metaColumns = list(metaColumns)
+        self.valueColumns = [column for column in self.columns if column not in self.metaColumns]
+        self.metas = []
+        self.metaIds = {}
+        self.rowMetas = array('L')
+        self.values = [[] for _ in self.valueColumns]
+
+    def meta(self, values):
+        """
+        :return metaId: Id of the meta tuple holding values (for metaColumns), added if it's new.
+        """
+        values = tuple(_intern(value) for value in values)
+        metaId = self.metaIds.get(values)
+        if metaId is None:
+            metaId = self.metaIds[values] = len(self.metas)
+            self.metas.append(values)
+        return metaId
+
+    def append(self, metaId, values):
+        self.rowMetas.append(metaId)
+        for column, value in zip(self.values, values):
+            column.append(_intern(value))
+
+    def __len__(self):
+        return len(self.rowMetas)
+
+    def rows(self):
+        """
+        :return rows: Generator of the table's rows as tuples, in column order.
+        """
+        positions = [(column in self.metaColumns, (self.metaColumns if column in self.metaColumns else self.valueColumns).index(column)) for column in self.columns]
+        for row, metaId in enumerate(self.rowMetas):
+            meta = self.metas[metaId]
+            yield tuple(meta[index] if isMeta else self.values[index][row] for isMeta, index in positions)
+
+    def frame(self):
+        """
+        :return frame: The table as a pandas DataFrame.
+        """
+        data = {}
+        for index, column in enumerate(self.metaColumns):
+            data[column] = [self.metas[metaId][index] for metaId in self.rowMetas]
+        data.update(zip(self.valueColumns, self.values))
+        return pd.DataFrame(data, columns=self.columns)
+
+
+def check_store():
+    return RowStore(CHECK_COLUMNS, CHECK_META_COLUMNS)
+
+
+def summary_store():
+    return RowStore(SUMMARY_COLUMNS, CHART_COLUMNS)
+
+
+def dep_store():
+    return RowStore(DEP_COLUMNS, CHART_COLUMNS)
@@ -1,39 +1,149 @@
+"""
+S3 Result Upload
+================
+
+Uploads result files to RESULT_BUCKET under results/<scan time>/ in the background while the scan carries on.
+Writers enqueue each file once it's complete, and a pool of threads uploads them with boto3's managed transfers,
+large files in concurrent multipart chunks.
+
+Completed uploads are recorded in a manifest (upload-manifest.jsonl in the results dir) by key, size and modification time,
+so a file is uploaded again only if it has been rewritten since. A file enqueued again while it's still uploading
+isn't uploaded twice; if it was rewritten meanwhile, it's checked again once the upload finishes.
+The run ends with a sweep of the results dir to upload anything not already in the manifest.
+
+The S3 client is created on first use, and S3_ENDPOINT_URL points it at any S3 compatible store, such as a local moto server for testing.
+
+:env RESULT_BUCKET: Bucket results are uploaded to.
+:env S3_ENDPOINT_URL: S3 endpoint to use instead of AWS.
+:env UPLOAD_CONCURRENCY: Files uploaded at once (default 8).
+:env UPLOAD_MULTIPART_THRESHOLD_MB: Size from which files are uploaded in parts (default 64), each of UPLOAD_MULTIPART_CHUNK_MB (default 16).
+"""
+
+import concurrent.futures
 import json
 import os
+import threading
 import logging as helmscanner_logging
 
 import boto3
+from boto3.s3.transfer import TransferConfig
+
+from helmScanner.scannerTimeStamp import currentRunTimestamp
+
+# Result files are uploaded by suffix, compared lower cased.
+UPLOAD_SUFFIXES = ('.csv', '.parquet', '.dockerfile')
+MANIFEST_FILE_NAME = 'upload-manifest.jsonl'
+MB = 1024 * 1024
+
+
+class UploadQueue:
+
+    def __init__(self, resultsPath, scanTime, concurrency, transferConfig):
+        self.resultsPath = resultsPath
+        self.scanTime = scanTime
+        self.transferConfig = transferConfig
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='upload')
+        self.lock = threading.Lock()
+        self.client = None
+        self.pending = set()
+        # key -> signature of uploads under way, and keys to check again once theirs finishes, as they were rewritten meanwhile.
+        self.inflight = {}
+        self.recheck = set()
+        self.manifestPath = f"{resultsPath}/{MANIFEST_FILE_NAME}"
+        self.uploaded = self._load_manifest()
+
+    def _load_manifest(self):
+        uploaded = {}
+        try:
+            with open(self.manifestPath) as manifest:
+                for line in manifest:
+                    entry = json.loads(line)
+                    uploaded[entry['key']] = entry['signature']
+        except FileNotFoundError:
+            pass
+        return uploaded
+
+    def _s3(self):
+        with self.lock:
+            if self.client is None:
+                self.client = boto3.client('s3', endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None)
+            return self.client
+
+    def key(self, path):
+        relativePath = os.path.relpath(os.path.abspath(path), self.resultsPath)
+        return f"results/{self.scanTime}/{relativePath.replace(os.sep, '/')}"
+
+    def enqueue(self, path):
+        """
+        Upload path in the background, unless it's unchanged since it was last uploaded.
+        """
+        future = self.executor.submit(self._upload, path)
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+    def _upload(self, path):
+        key = self.key(path)
+        try:
+            fileStat = os.stat(path)
+        except OSError as e:
+            helmscanner_logging.error(f'Failed to upload {key}. Error was: {e}')
+            return
+        signature = [fileStat.st_size, fileStat.st_mtime_ns]
+        # The skip check and claiming the key happen together, so a file enqueued again while it's uploading isn't uploaded twice.
+        with self.lock:
+            if signature in (self.uploaded.get(key), self.inflight.get(key)):
+                return
+            if key in self.inflight:
+                self.recheck.add(key)
+                return
+            self.inflight[key] = signature
+        try:
+            self._s3().upload_file(path, os.environ['RESULT_BUCKET'], key, Config=self.transferConfig)
+            with self.lock:
+                self.uploaded[key] = signature
+                with open(self.manifestPath, 'a') as manifest:
+                    manifest.write(json.dumps({'key': key, 'signature': signature}) + '\n')
+            helmscanner_logging.info(f'Uploaded {key}')
+        except Exception as e:
+            helmscanner_logging.error(f'Failed to upload {key} via boto3. Error was: {e}')
+        finally:
+            with self.lock:
+                del self.inflight[key]
+                rewritten = key in self.recheck
+                self.recheck.discard(key)
+            if rewritten:
+                self.enqueue(path)
+
+    def sweep(self):
+        """
+        Enqueue every result file under the results dir, so anything not already uploaded is.
+        """
+        for dirPath, _, filenames in os.walk(self.resultsPath):
+            for filename in filenames:
+                if filename.lower().endswith(UPLOAD_SUFFIXES):
+                    self.enqueue(os.path.join(dirPath, filename))
+
+    def flush(self):
+        """
+        Wait for every upload enqueued so far, and any they enqueue again.
+        """
+        while True:
+            with self.lock:
+                pending = [future for future in self.pending if not future.done()]
+            if not pending:
+                return
+            concurrent.futures.wait(pending)
+
+
+def open_queue(resultsPath, scanTime):
+    transferConfig = TransferConfig(multipart_threshold=int(os.environ.get('UPLOAD_MULTIPART_THRESHOLD_MB', default=64)) * MB,
+                                    multipart_chunksize=int(os.environ.get('UPLOAD_MULTIPART_CHUNK_MB', default=16)) * MB)
+    return UploadQueue(resultsPath, scanTime, int(os.environ.get('UPLOAD_CONCURRENCY', default=8)), transferConfig)
+
 
-s3 = boto3.client('s3')
-
-
-def upload_results_to_s3(results_path, scan_time, partialUpload):
-    subdirList = ['checks','summaries','deps','containers','container_summaries']
-    for subdir in subdirList:
-        for filename in os.listdir(f"{results_path}/{subdir}"):
-            helmscanner_logging.info(f'Found file: {subdir}/{filename}')
-            if filename.lower().endswith('.csv'):
-                helmscanner_logging.info(f'Uploading file: {subdir}/{filename}')
-                try: 
-                    s3.upload_file(f'{results_path}/{subdir}/{filename}', os.environ['RESULT_BUCKET'], f'results/{scan_time}/{subdir}/{filename}')
-                    helmscanner_logging.info(f'Uploaded {subdir}/{filename}')
-                    if partialUpload:
-                        helmscanner_logging.info(f'Partial upload selected, renaming {subdir}/{filename} to {subdir}/{filename}.uploaded')
-                        os.rename(filename, f"{filename}.uploaded")
-                except Exception as e:
-                    helmscanner_logging.error(f'Failed to upload via boto3. Error was: {e}')
-    for filename in os.listdir(f"{results_path}/dockerfiles"):
-        if filename.lower().endswith('.Dockerfile'):
-                helmscanner_logging.info(f'Uploading file: dockerfiles/{filename}')
-                try: 
-                    s3.upload_file(f'{results_path}/dockerfiles/{filename}', os.environ['RESULT_BUCKET'], f'results/{scan_time}/dockerfiles/{filename}')
-                    helmscanner_logging.info(f'Uploaded {subdir}/{filename}')
-                    if partialUpload:
-                        helmscanner_logging.info(f'Partial upload selected, renaming dockerfiles/{filename} to dockerfiles/{filename}.uploaded')
-                        os.rename(filename, f"{filename}.uploaded")
-                except Exception as e:
-                    helmscanner_logging.error(f'Failed to upload via boto3. Error was: {e}')
-
-
-def upload_results(results_path, scan_time, partialUpload):
-    upload_results_to_s3(results_path, scan_time, partialUpload)
+uploadQueue = open_queue(f'{os.path.abspath(os.path.curdir)}/results/{currentRunTimestamp}', currentRunTimestamp)
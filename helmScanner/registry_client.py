@@ -0,0 +1,129 @@
+"""
+Registry Client
+===============
+
+Resolves image tags to manifest digests with a HEAD request against the registry's manifest endpoint (Docker Registry HTTP API v2), without pulling anything.
+Requests share one pooled session, and registries asking for bearer token auth get an anonymous token, which is cached for its lifetime.
+A whole batch of images is resolved concurrently on the scheduler's registry lane, whose worker limit (LANE_REGISTRY_WORKERS) caps the requests in flight.
+
+:env REGISTRY_CONCURRENCY: Default worker limit for the registry lane (default 16).
+
+:env INSECURE_REGISTRIES: Comma separated registries (host[:port]) reached over plain http, e.g. a local registry stand-in. localhost and 127.0.0.1 always are.
+:env REGISTRY_TIMEOUT: Timeout in seconds for registry requests (default 10).
+"""
+
+import logging as helmscanner_logging
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from helmScanner.scheduler import scheduler
+
+DOCKER_HUB_REGISTRY = 'docker.io'
+DOCKER_HUB_API_HOST = 'registry-1.docker.io'
+MANIFEST_ACCEPT = ', '.join([
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+])
+CHALLENGE_PARAM_PATTERN = re.compile(r'(\w+)="([^"]*)"')
+
+
+class RegistryClient:
+
+    def __init__(self, insecureRegistries=None, concurrency=None, timeout=None):
+        if insecureRegistries is None:
+            insecureRegistries = [registry.strip() for registry in os.environ.get('INSECURE_REGISTRIES', default='').split(',') if registry.strip()]
+        self.insecureRegistries = set(insecureRegistries)
+        # One pooled connection per registry lane worker.
+        self.concurrency = concurrency or scheduler.lanes['registry'].workers
+        self.timeout = timeout or float(os.environ.get('REGISTRY_TIMEOUT', default=10))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.lock = threading.Lock()
+        # (registry, repository) -> (token, expiry)
+        self.tokens = {}
+
+    def _base_url(self, registry):
+        host = DOCKER_HUB_API_HOST if registry == DOCKER_HUB_REGISTRY else registry
+        insecure = registry in self.insecureRegistries or host.split(':')[0] in ('localhost', '127.0.0.1')
+        return f"{'http' if insecure else 'https'}://{host}"
+
+    def _cached_token(self, key):
+        with self.lock:
+            token, expiry = self.tokens.get(key, (None, 0))
+        return token if time.monotonic() < expiry else None
+
+    def _fetch_token(self, key, challenge):
+        """
+        Answer a `WWW-Authenticate: Bearer realm=...,service=...,scope=...` challenge with an anonymous token.
+
+        :return token: The bearer token, or None if the challenge isn't a bearer challenge, the token request failed or its response was malformed.
+        """
+        if not challenge.lower().startswith('bearer '):
+            return None
+        params = dict(CHALLENGE_PARAM_PATTERN.findall(challenge))
+        realm = params.pop('realm', None)
+        if not realm:
+            return None
+        response = self.session.get(realm, params=params, timeout=self.timeout)
+        if not response.ok:
+            return None
+        try:
+            body = response.json()
+            token = body.get('token') or body.get('access_token')
+            # Registries default to 60 second tokens; refresh a little early.
+            expiry = time.monotonic() + max(int(body.get('expires_in', 60)) - 10, 0)
+        except (ValueError, TypeError, AttributeError) as err:
+            helmscanner_logging.info(f"Ignoring malformed token response from {realm}: {err}")
+            return None
+        if not token:
+            return None
+        with self.lock:
+            self.tokens[key] = (token, expiry)
+        return token
+
+    def resolve_digest(self, image_reference):
+        """
+        :param image_reference: ImageReference to resolve.
+        :return digest: The manifest digest image_reference currently points at, or None if it couldn't be resolved.
+        """
+        if image_reference.digest:
+            return image_reference.digest
+        key = (image_reference.registry, image_reference.repository)
+        url = f"{self._base_url(image_reference.registry)}/v2/{image_reference.repository}/manifests/{image_reference.tag}"
+        headers = {'Accept': MANIFEST_ACCEPT}
+        token = self._cached_token(key)
+        try:
+            for attempt in range(2):
+                if token:
+                    headers['Authorization'] = f"Bearer {token}"
+                response = self.session.head(url, headers=headers, timeout=self.timeout)
+                if response.status_code == 401 and attempt == 0:
+                    token = self._fetch_token(key, response.headers.get('WWW-Authenticate', ''))
+                    if token:
+                        continue
+                break
+        except requests.exceptions.RequestException as err:
+            helmscanner_logging.info(f"Unable to resolve {image_reference} from its registry: {err}")
+            return None
+        if not response.ok:
+            helmscanner_logging.info(f"Unable to resolve {image_reference} from its registry: HTTP {response.status_code}")
+            return None
+        return response.headers.get('Docker-Content-Digest')
+
+    def resolve_all(self, imageList):
+        """
+        Resolve a batch of ImageReferences concurrently, on the scheduler's registry lane.
+
+        :return digests: Dict of ImageReference to manifest digest, or None where it couldn't be resolved.
+        """
+        futures = {image_reference: scheduler.submit('registry', self.resolve_digest, image_reference) for image_reference in imageList}
+        return {image_reference: future.result() for image_reference, future in futures.items()}
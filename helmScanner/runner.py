@@ -2,82 +2,57 @@ import datetime
 import os
 import errno
 import sys
-from collections import defaultdict
-import subprocess
-import wget
 import traceback
-import tarfile
-import glob
-import re
 import logging as helmscanner_logging
 
 from helmScanner.collect import artifactHubCrawler
+from helmScanner.collect import chart_cache
+from helmScanner.collect import chart_extractor
+from helmScanner.output import check_rows
+from helmScanner.output import deps_aggregator
+from helmScanner.output import parquet_writer
 from helmScanner.output import result_writer
-from helmScanner.output import s3_uploader
-from helmScanner.multithreader import multithreadit
-from helmScanner.image_scanner import imageScanner
+from helmScanner.output import row_store
+from helmScanner.output.s3_uploader import uploadQueue
+from helmScanner.scheduler import scheduler
+from helmScanner import chart_renderer
+from helmScanner import checkov_cache
+from helmScanner import checkov_worker
+from helmScanner.chart_dependencies import chart_dependencies
+from helmScanner.image_references import image_references
+from helmScanner.image_scanner import ImageScanner
 from helmScanner.scannerTimeStamp import currentRunTimestamp
 #from helmScanner.export import s3_uploader
 
 
 # Local setup of checkov
 from checkov.logging_init import init as logging_init
-from checkov.helm.registry import registry
-from checkov.helm.runner import Runner as helm_runner
 # Checkov logging so we dont default to debug output from checkov.
 logging_init()
-#from checkov.kubernetes.runner import Runner as k8_runner
 
 SCAN_TIME = currentRunTimestamp
 RESULTS_PATH = f'{os.path.abspath(os.path.curdir)}/results/{SCAN_TIME}'
 
+writeCsv, writeParquet = parquet_writer.output_formats()
+parquetSink = parquet_writer.ParquetSink(f'{RESULTS_PATH}/parquet') if writeParquet else None
+depsAggregator = deps_aggregator.open_aggregator(RESULTS_PATH)
+
 #Graph no longer global, per repo.
 #depGraph=pgv.AGraph(strict=False,directed=True)
-globalDepsUsage = {}
-globalDepsList = defaultdict(list)
+chartCache = chart_cache.open_cache()
+checkovCache = checkov_cache.open_cache()
+imageScanner = ImageScanner()
 emptylist = []
 
-def extract(tar_url, extract_path='.'):
-    helmscanner_logging.debug(tar_url)
-    tar = tarfile.open(tar_url, 'r')
-    for item in tar:
-        tar.extract(item, extract_path)
-        if item.name.find(".tgz") != -1 or item.name.find(".tar") != -1:
-            extract(item.name, "./" + item.name[:item.name.rfind('/')])
-
-
-def parse_helm_dependency_output(o):
-    output = o.decode('utf-8')
-    chart_dependencies={}
-    if "WARNING" in output:
-        #Helm output showing no deps, example: 'WARNING: no dependencies at helm-charts/charts/prometheus-kafka-exporter/charts\n'
-        pass
-    else: 
-        lines = output.split('\n')
-        for line in lines:
-            if line != "":
-                if not "NAME" in line:
-                    chart_name, chart_version, chart_repo, chart_status = line.split("\t")
-                    chart_dependencies.update({chart_name.rstrip():{'chart_name': chart_name.rstrip(), 'chart_version': chart_version.rstrip(), 'chart_repo': chart_repo.rstrip(), 'chart_status': chart_status.rstrip()}})
-    return chart_dependencies
-
 def scan_files():
     if not os.environ.get('RESULT_BUCKET'):
         helmscanner_logging.error("No upload destination set as RESULT_BUCKET env. Quitting.")
         exit()
+    # Checkov runs in worker processes started from a fork server, which loads checkov once for all of them.
+    scheduler.use_processes('checkov', checkov_worker.init_worker, checkov_worker.PRELOAD)
     crawler = artifactHubCrawler.ArtifactHubCrawler()
-    crawlDict, totalRepos, totalPackages = crawler.crawl()
-    helmscanner_logging.info(f"Crawl completed with {totalPackages} charts from {totalRepos} repositories.")
-
-    crawlList = crawlDict
-
-    checks_table = []
-    summary_table = []
-    all_resources = []
-    empty_resources_total = {}
-    all_dataobj = []
 
-    for directories in ['checks', 'summaries', 'deps', 'containers', 'container_summaries', 'dockerfiles']:
+    for directories in ['checks', 'summaries', 'deps', 'containers', 'container_summaries', 'dockerfiles', 'parquet']:
         filename = f"results/{currentRunTimestamp}/{directories}/blah.tmp"
         if not os.path.exists(os.path.dirname(filename)):
             try:
@@ -86,58 +61,61 @@ def scan_files():
                 if exc.errno != errno.EEXIST:
                     raise
 
-     # Call Threaded Function to scan an org.
-    #repoChartPackages = crawlDict[repoCount]['repoPackages']
-    helmscanner_logging.info(len(crawlList))
-    multithreadit(_scan_org, crawlList, crawlList)
-    #for repoCount in crawlDict:
-        # Call Threaded Function to scan an org.
-        #repoChartPackages = crawlDict[repoCount]['repoPackages']
-    
-    
-
-def check_category(check_id):
-    if (registry.get_check_by_id(check_id)) is not None:
-        return registry.get_check_by_id(check_id).categories[0]
-
-def _scan_org(crawlList, orgOffset):
-    repo = crawlList[orgOffset]
-    summary_lst = []
-    result_lst = []
-    helmdeps_lst = []
+    # Scan each org on the scheduler's org lane as soon as the crawler has resolved its packages.
+    # The crawler's queue (CRAWL_QUEUE_SIZE) and the lane's pending limit hold the crawl back when scanning falls behind.
+    try:
+        scheduler.map_stream('org', _scan_org, crawler.crawl_stream())
+        helmscanner_logging.info(f"Crawl and scan completed with {crawler.totalPackages} charts from {crawler.totalRepos} repositories.")
+    finally:
+        # A failed run still writes out and uploads what it scanned.
+        scheduler.log_metrics()
+        _finish_results()
+
+def _finish_results():
+    # Each file is closed even if closing an earlier one failed. Parquet files are only complete, and uploaded, once closed.
+    closers = [('container results', imageScanner.containerResults.close), ('global deps tables', depsAggregator.write)]
+    if parquetSink:
+        closers.append(('parquet files', parquetSink.close))
+    for name, close in closers:
+        try:
+            for path in close() or []:
+                uploadQueue.enqueue(path)
+        except Exception as e:
+            helmscanner_logging.error(f"Failed to write {name}: {e}")
+    helmscanner_logging.info(f'Uploading remaining results to {os.environ["RESULT_BUCKET"]}')
+    uploadQueue.sweep()
+    uploadQueue.flush()
+
+def _scan_org(repo):
+    summary_lst = row_store.summary_store()
+    result_lst = row_store.check_store()
+    helmdeps_lst = row_store.dep_store()
     empty_resources = {}
     orgRepoFilename = f"{repo['repoName']}"
     extract_failures = []
     download_failures = []
     parse_deps_failures = []
 
-    repoName = crawlList[orgOffset]['repoName']
-    repoDetailsDict = crawlList[orgOffset]
-
-    for chartPackage in crawlList[orgOffset]['repoPackages']:
+    repoName = repo['repoName']
+    repoDetailsDict = repo
 
-        chartNameFromResultDataExpression = '(.*)\.(RELEASE-NAME-)?(.*)(\.default)?'
-        chartNameFromResultDataExpressionGroup = 3
+    # Charts are checked out of the cache with the next few already downloading while this one is scanned.
+    for chartPackage, chartCheckout in chartCache.checkouts(repo['repoPackages']):
 
         repoChartPathName = f"{repo['repoName']}/{chartPackage['name']}"
+        chartMeta = (currentRunTimestamp, repoChartPathName, repo['repoName'], chartPackage['name'], chartPackage['version'])
         ## DEBUG: Disable specific repo for scanning
         #if orgRepoFilename == "reponame":
         #    continue
-        if True:
+        # Each chart is extracted into its own scratch dir, removed once the chart has been scanned.
+        with chart_extractor.scratch_dir() as downloadPath:
             helmscanner_logging.info(f"Scanning {repo['repoName']}/{chartPackage['name']}| Download Source ")
-            # Setup local dir and download
-            repoChartPathName = f"{repo['repoName']}/{chartPackage['name']}"
-            downloadPath = f'{RESULTS_PATH}/{repoChartPathName}'
-
-            if not os.path.exists(downloadPath):
-                    os.makedirs(downloadPath)
             try:
-                wget.download(chartPackage['content_url'], downloadPath)
-                for filename in glob.glob(f"{downloadPath}/**.tgz", recursive=False):
+                # Unchanged charts come straight from the local chart cache rather than being downloaded again.
+                with chartCheckout as chartArchive:
                     try: 
-                        extract(filename, downloadPath)
+                        chart_extractor.extract(chartArchive, downloadPath)
                         helmscanner_logging.info(f"Scanning {repo['repoName']}/{chartPackage['name']}| Extract Source ")
-                        os.remove(filename)
                     except:
                         helmscanner_logging.warning(f"Failed to extract {repo['repoName']}/{chartPackage['name']}")
                         extract_failures.append([f"{repo['repoName']}/{chartPackage['name']}"])
@@ -148,33 +126,17 @@ def _scan_org(crawlList, orgOffset):
         
 
             helmscanner_logging.info(f"SCAN OF {repo['repoName']}/{chartPackage['name']} | Processing Chart Deps")
-            proc = subprocess.Popen(["helm", 'dependency', 'list' , f"{downloadPath}/{chartPackage['name']}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            o, e = proc.communicate()
-            if e:
-                if "Warning: Dependencies" in str(e, 'utf-8'):
-                    helmscanner_logging.warning(f"V1 API chart without Chart.yaml dependancies. Skipping chart dependancy list for {chartPackage['name']} at dir: {downloadPath}/{chartPackage['name']}. Error details: {str(e, 'utf-8')}")
-                else: 
-                    helmscanner_logging.warning(f"Error processing helm dependancies for {chartPackage['name']} at source dir: {downloadPath}/{chartPackage['name']}. Error details: {str(e, 'utf-8')}")
-            chart_deps = parse_helm_dependency_output(o)
+            try:
+                chart_deps = chart_dependencies(f"{downloadPath}/{chartPackage['name']}")
+            except Exception as e:
+                helmscanner_logging.warning(f"Error processing helm dependancies for {chartPackage['name']} at source dir: {downloadPath}/{chartPackage['name']}. Error details: {e}")
+                chart_deps = {}
             helmscanner_logging.debug(chart_deps)
-            helmout = subprocess.Popen(["helm", 'template', f"{downloadPath}/{chartPackage['name']}"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            out, err = helmout.communicate()
-            imageList = []
-            for line in out.decode('utf-8').split('\n'):
-                if 'image:' in line:
-                    line = line.replace('"', '')
-                    line = line.replace(' ', '')
-                    img=line.split(':')
-                    imagename = img[1]
-                    # if there's no tag it means "latest"
-                    if len(img) < 3:
-                        tag = "latest"
-                    else:
-                        tag = img[2]
-                    imageList.append(f"{imagename}:{tag}")
-            # get rid of the duplicates to save time
-            imageList = list(dict.fromkeys(imageList))
-            helmscanner_logging.info(f"Found images: {imageList} in chart {downloadPath}/{chartPackage['name']}")
+            # Render once; the manifests feed both image discovery and Checkov.
+            helmscanner_logging.info(f"SCAN OF {repo['repoName']}/{chartPackage['name']} | Rendering Chart")
+            rendered = scheduler.run('render', chart_renderer.render, f"{downloadPath}/{chartPackage['name']}")
+            imageList = image_references(rendered) if rendered is not None else []
+            helmscanner_logging.info(f"Found images: {[str(image) for image in imageList]} in chart {downloadPath}/{chartPackage['name']}")
 
             imageScanner._scan_images(repoChartPathName, imageList) 
             helmscanner_logging.info("Done Scanning Images")
@@ -182,158 +144,57 @@ def _scan_org(crawlList, orgOffset):
             # Assign results_scan outside of try objects.
             results_scan = object
             try:
-                helmscanner_logging.info(f"SCAN OF {repo['repoName']}/{chartPackage['name']} | Running Checkov")
-                runner = helm_runner()
-                results_scan = runner.run(root_folder=downloadPath, external_checks_dir=None, files=None)
-                res = results_scan.get_dict()
+                # A chart helm can't render is recorded as an error in scan, not as an empty scan.
+                if rendered is None:
+                    raise RuntimeError(f"{repoChartPathName} failed to render")
+                results_scan = checkovCache.get(rendered) if checkovCache else None
+                if results_scan is None:
+                    helmscanner_logging.info(f"SCAN OF {repo['repoName']}/{chartPackage['name']} | Running Checkov")
+                    # Manifests get their own scratch dir, so they can't mix with the chart's own files whatever the chart is called.
+                    with chart_extractor.scratch_dir('manifests-') as manifestDir:
+                        manifestPath = chart_renderer.write_manifests(rendered, manifestDir)
+                        results_scan = scheduler.run('checkov', checkov_worker.scan_manifests, manifestPath)
+                    if checkovCache:
+                        checkovCache.put(rendered, results_scan)
+                else:
+                    helmscanner_logging.info(f"SCAN OF {repo['repoName']}/{chartPackage['name']} | Reusing cached Checkov results")
                 helmscanner_logging.info(f"SCAN OF {repo['repoName']}/{chartPackage['name']} | Processing Results")
-                for passed_check in res["results"]["passed_checks"]:
-                    chartNameFromResultData = re.search(chartNameFromResultDataExpression, passed_check["resource"]).group(chartNameFromResultDataExpressionGroup)
-                    ## NEW. Default items if no key exists for non-critical components
-                    check = [
-                        currentRunTimestamp,
-                        repoChartPathName,
-                        repo['repoName'],
-                        chartPackage['name'],
-                        chartPackage['version'],
-                        chartPackage['ts'],
-                        chartPackage.get('signed','no data'),
-                        chartPackage.get('security_report_created_at','no data'),
-                        chartNameFromResultData,   
-                        chartPackage.get('is_operator','no data'),
-                        str(check_category(passed_check["check_id"])).lstrip("CheckCategories."),
-                        passed_check["check_id"],
-                        passed_check["check_name"],
-                        passed_check["check_result"]["result"],
-                        passed_check["file_path"],
-                        passed_check["check_class"],
-                        passed_check["resource"].split(".")[0],
-                        repo['repoRaw']['repository_id'],
-                        repo['repoRaw']['digest'],
-                        repo['repoRaw']['last_tracking_ts'],
-                        repo['repoRaw']['verified_publisher'],
-                        repo['repoRaw']['official'],
-                        repo['repoRaw']['scanner_disabled']
-                        ]
-
-                    result_lst.append(check)
-                for failed_check in res["results"]["failed_checks"]:
-                    chartNameFromResultData = re.search(chartNameFromResultDataExpression, failed_check["resource"]).group(chartNameFromResultDataExpressionGroup)
-                    check = [
-                        currentRunTimestamp,
-                        repoChartPathName,
-                        repo['repoName'],
-                        chartPackage['name'],
-                        chartPackage['version'],
-                        chartPackage['ts'],
-                        chartPackage.get('signed','no data'),
-                        chartPackage.get('security_report_created_at','no data'),
-                        chartNameFromResultData,   
-                        chartPackage.get('is_operator','no data'),
-                        str(check_category(failed_check["check_id"])).lstrip("CheckCategories."),
-                        failed_check["check_id"],
-                        failed_check["check_name"],
-                        failed_check["check_result"]["result"],
-                        failed_check["file_path"],
-                        failed_check["check_class"],
-                        failed_check["resource"].split(".")[0],
-                        repo['repoRaw']['repository_id'],
-                        repo['repoRaw']['digest'],
-                        repo['repoRaw']['last_tracking_ts'],
-                        repo['repoRaw']['verified_publisher'],
-                        repo['repoRaw']['official'],
-                        repo['repoRaw']['scanner_disabled']
-                        ]
-                    #check.extend(self.add_meta(scan_time))
-                    result_lst.append(check)
-                if results_scan.is_empty():
-                    check = [
-                        currentRunTimestamp,
-                        repoChartPathName,
-                        repo['repoName'],
-                        chartPackage['name'],
-                        chartPackage['version'],
-                        chartPackage['ts'],
-                        chartPackage.get('signed','no data'),
-                        chartPackage.get('security_report_created_at','no data'),
-                        "empty scan",   
-                        chartPackage.get('is_operator','no data'),
-                        "empty scan",
-                        "empty scan",
-                        "empty scan",
-                        "empty scan",
-                        "empty scan",
-                        "empty scan",
-                        "empty scan",
-                        repo['repoRaw']['repository_id'],
-                        repo['repoRaw']['digest'],
-                        repo['repoRaw']['last_tracking_ts'],
-                        repo['repoRaw']['verified_publisher'],
-                        repo['repoRaw']['official'],
-                        repo['repoRaw']['scanner_disabled']
-                        ]
-                    #check.extend(self.add_meta(scan_time))
-                    result_lst.append(check)
-                    #empty_resources = self.module_resources()
+                check_rows.add_check_rows(result_lst, result_lst.meta(check_rows.chart_meta(repo, chartPackage, repoChartPathName)), results_scan)
             except Exception:
                 helmscanner_logging.error('unexpected error in scan')
                 exc_type, exc_value, exc_traceback = sys.exc_info()
                 tb = traceback.format_exception(exc_type, exc_value, exc_traceback)
-                check = [
-                        currentRunTimestamp,
-                        repoChartPathName,
-                        repo['repoName'],
-                        chartPackage['name'],
-                        chartPackage['version'],
+                errorMeta = result_lst.meta((
+                        *chartMeta,
                         chartPackage['ts'],
                         chartPackage.get('signed','no data'),
                         chartPackage.get('security_report_created_at','no data'),
-                        "error in scan",   
                         chartPackage.get('is_operator','no data'),
-                        "error in scan",
-                        "error in scan",
-                        "error in scan",
-                        "error in scan",
-                        "error in scan",
-                        "error in scan",
-                        "error in scan",
                         repo['repoRaw']['repository_id'],
                         "error in scan",
                         "error in scan",
                         repo['repoRaw']['verified_publisher'],
                         repo['repoRaw']['official'],
                         repo['repoRaw']['scanner_disabled']
-                        ]
-
-                result_lst.append(check)
+                        ))
+                result_lst.append(errorMeta, ("error in scan",) * 8)
 
             # Summary Results
             try:
                 helmscanner_logging.info(f"SCAN OF {repo['repoName']}/{chartPackage['name']} | Processing Summaries")
-                res = results_scan.get_dict()
-                summary_lst_item = [
-                    currentRunTimestamp,
-                    repoChartPathName,
-                    repo['repoName'],
-                    chartPackage['name'],
-                    chartPackage['version'],
+                summary_lst_item = (
                     chartPackage['ts'],
                     chartPackage.get('signed', 'No Data'),
                     chartPackage.get('security_report_created_at', 'No Data'),
                     chartPackage['name'],   
                     chartPackage.get('is_operator', 'No Data'),
                     "success",
-                    res["summary"]["passed"],
-                    res["summary"]["failed"],
-                    res["summary"]["parsing_errors"]
-                ]
+                    results_scan["summary"]["passed"],
+                    results_scan["summary"]["failed"],
+                    results_scan["summary"]["parsing_errors"]
+                )
             except:
-                summary_lst_item = [
-                    currentRunTimestamp,
-                    repoChartPathName,
-                    repo['repoName'],
-                    chartPackage['name'],
-                    chartPackage['version'],
+                summary_lst_item = (
                     chartPackage['ts'],
                     chartPackage.get('signed', 'No Data'),
                     chartPackage.get('security_report_created_at', 'No Data'),
@@ -343,49 +204,44 @@ def _scan_org(crawlList, orgOffset):
                     0,
                     0,
                     0
-                ]
-            summary_lst.append(summary_lst_item)
+                )
+            summary_lst.append(summary_lst.meta(chartMeta), summary_lst_item)
 
             # Helm Dependancies
             try:
-                res = results_scan.get_dict()
                 helmscanner_logging.info(f"SCAN OF {repo['repoName']}/{chartPackage['name']} | Processing Helm Dependancies")
                 #{'common': {'chart_name': 'common', 'chart_version': '0.0.5', 'chart_repo': 'https://charts.adfinis.com', 'chart_status': 'unpacked'}}
-                if chart_deps:
+                # Dependencies are only recorded for charts Checkov scanned.
+                if chart_deps and results_scan is not object:
                     for key in chart_deps:
                         helmscanner_logging.debug(f" HELMDEP FOUND! {chart_deps[key]}")
                         current_dep = chart_deps[key]
                         
-                        dep_item = [
-                            currentRunTimestamp,
-                            repoChartPathName, #Current chart combined repo/path
-                            repo['repoName'],  #Current chart reponame
-                            chartPackage['name'], #Current chart chartname
-                            chartPackage['version'], #Current chart version
+                        # Combined repo/path, reponame, chartname and version come from chartMeta.
+                        dep_item = (
                             list(current_dep.values())[0], #dep dict chart_name
                             list(current_dep.values())[1], #dep dict chart_version
                             list(current_dep.values())[2], #dep dict chart_repo
                             list(current_dep.values())[3]  #dep dict chart_status
-                        ]
+                        )
 
-                        helmdeps_lst.append(dep_item)
+                        helmdeps_lst.append(helmdeps_lst.meta(chartMeta), dep_item)
 
-                helmscanner_logging.debug(f"CURRENT HELMDEPS LIST {helmdeps_lst}")
+                helmscanner_logging.debug(f"CURRENT HELMDEPS LIST {len(helmdeps_lst)} deps")
                     
             except:
                 pass
 
-    helmscanner_logging.debug(f"Global deps usage: {globalDepsUsage}")
-    helmscanner_logging.debug(f"Global deps list {globalDepsList}")
-
-    result_writer.print_csv(summary_lst, result_lst, helmdeps_lst, empty_resources, RESULTS_PATH, repo['repoName'], orgRepoFilename, globalDepsList, globalDepsUsage)
-    #Upload and rename per org, rather than waiting till the end of the run.
-    uploadResultsPartial()
+    for path in depsAggregator.add(helmdeps_lst):
+        uploadQueue.enqueue(path)
 
-def uploadResultsPartial():
-    if os.environ.get('RESULT_BUCKET'):
-        helmscanner_logging.info(f'Uploading results to {os.environ["RESULT_BUCKET"]}')
-        s3_uploader.upload_results(RESULTS_PATH, SCAN_TIME, True)
+    scheduler.log_metrics()
+    if parquetSink:
+        result_writer.print_parquet(parquetSink, summary_lst, result_lst, helmdeps_lst)
+    #Upload per org in the background, rather than waiting till the end of the run.
+    if writeCsv:
+        for path in result_writer.print_csv(summary_lst, result_lst, helmdeps_lst, empty_resources, RESULTS_PATH, repo['repoName'], orgRepoFilename):
+            uploadQueue.enqueue(path)
 
 def run():
     scan_files()
@@ -0,0 +1,21 @@
+"""
+Cache directory for helm-scanner
+================================
+
+Caches which should outlive a single run of helm-scanner live under one base directory.
+It sits outside the workspace by default, so checkouts and the results/artifact cleanup between scheduled runs leave it alone.
+
+:env HELM_SCANNER_CACHE_DIR: Base directory for persistent caches (default ~/.cache/helm-scanner).
+"""
+
+import os
+
+helmScannerCacheDir = os.environ.get('HELM_SCANNER_CACHE_DIR', default=os.path.expanduser('~/.cache/helm-scanner'))
+
+def cachePath(name):
+    """
+    :param name: File or directory name of a cache.
+    :return path: Location of that cache under the base cache directory, which is created if missing.
+    """
+    os.makedirs(helmScannerCacheDir, exist_ok=True)
+    return os.path.join(helmScannerCacheDir, name)
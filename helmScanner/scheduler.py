@@ -0,0 +1,178 @@
+"""
+Work Scheduler
+==============
+
+One scheduler for all scanning work in a run. Work is split into lanes by the resource it uses, and each lane has its own worker limit,
+so downloads, helm renders, Checkov, docker pulls and twistcli can't crowd each other out or multiply into nested pools.
+
+Lanes:
+
+- org: Repositories being scanned, each working through its charts and waiting on the lanes below.
+- download: Chart archive downloads.
+- registry: Registry manifest requests, resolving image tags to digests.
+- render: `helm template` runs.
+- checkov: Checkov policy evaluation.
+- image: Per-image coordination, waiting on the pull and twistcli lanes.
+- pull: Docker pulls.
+- twistcli: twistcli image scans.
+
+Work in a lane may wait on work in another lane, but never on its own lane, which could otherwise fill with workers all waiting on each other.
+Lanes run on threads, except lanes switched to worker processes with use_processes() (the checkov lane), for CPU bound Python work.
+Every lane keeps queue depth and throughput counters, logged with log_metrics().
+
+:env LANE_<NAME>_WORKERS: Worker limit for a lane, e.g. LANE_PULL_WORKERS=8.
+"""
+
+import concurrent.futures
+import logging as helmscanner_logging
+import math
+import multiprocessing
+import os
+import threading
+
+CPU_COUNT = os.cpu_count() or 1
+LANE_DEFAULTS = {
+    'org': math.ceil(CPU_COUNT * 0.7),
+    'download': 16,
+    # REGISTRY_CONCURRENCY predates the lane, and still sets its default.
+    'registry': int(os.environ.get('REGISTRY_CONCURRENCY', default=16)),
+    'render': CPU_COUNT,
+    'checkov': CPU_COUNT,
+    'image': 32,
+    'pull': 4,
+    'twistcli': math.ceil(CPU_COUNT / 2),
+}
+
+
+class Lane:
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"lane-{name}")
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.peakQueued = 0
+
+    def _run(self, func, args):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            result = func(*args)
+        except:
+            with self.lock:
+                self.failed += 1
+            raise
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+        return result
+
+    def _done(self, future):
+        # Process lanes can't report when a task starts, so queued and running are worked out from tasks outstanding.
+        with self.lock:
+            self.queued -= 1
+            self.completed += 1
+            if future.exception() is not None:
+                self.failed += 1
+
+    def submit(self, func, *args):
+        with self.lock:
+            self.queued += 1
+            self.peakQueued = max(self.peakQueued, self.queued)
+        if isinstance(self.executor, concurrent.futures.ProcessPoolExecutor):
+            future = self.executor.submit(func, *args)
+            future.add_done_callback(self._done)
+            return future
+        return self.executor.submit(self._run, func, args)
+
+    def use_processes(self, initializer=None, preload=()):
+        self.executor.shutdown(wait=True)
+        # Workers are forked from a fork server rather than from this process, whose clients, sessions, caches and threads they must not inherit.
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(list(preload))
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=initializer)
+        # Start the workers now, so they are initialized while the crawl gets going rather than on the first scan.
+        self.executor.submit(int)
+
+    def metrics(self):
+        with self.lock:
+            queued, running = self.queued, self.running
+            if isinstance(self.executor, concurrent.futures.ProcessPoolExecutor):
+                running = min(queued, self.workers)
+                queued -= running
+            return {'workers': self.workers, 'queued': queued, 'running': running, 'completed': self.completed, 'failed': self.failed, 'peak queued': self.peakQueued}
+
+
+class WorkScheduler:
+
+    def __init__(self, laneWorkers=None):
+        laneWorkers = laneWorkers or {}
+        self.lanes = {}
+        for name, default in LANE_DEFAULTS.items():
+            workers = laneWorkers.get(name) or int(os.environ.get(f"LANE_{name.upper()}_WORKERS", default=default))
+            self.lanes[name] = Lane(name, workers)
+
+    def submit(self, lane, func, *args):
+        """
+        :return future: concurrent.futures.Future of func(*args), run on the named lane.
+        """
+        return self.lanes[lane].submit(func, *args)
+
+    def use_processes(self, lane, initializer=None, preload=()):
+        """
+        Switch a lane to a persistent pool of worker processes, each running initializer once as it starts.
+        Workers are forked from a fork server: a fresh single-threaded process which imports only the preload modules,
+        so they share those imports without inheriting anything else from this process. They are started immediately.
+        Work submitted to the lane must then be picklable: module level functions with picklable arguments and results,
+        and the main module must be safe to import, since each worker imports it as __mp_main__.
+        """
+        self.lanes[lane].use_processes(initializer, preload)
+
+    def run(self, lane, func, *args):
+        """
+        Run func(*args) on the named lane and wait for its result. Must not be called from a worker of the same lane.
+        """
+        return self.submit(lane, func, *args).result()
+
+    def map_stream(self, lane, func, iterable, max_pending=None):
+        """
+        Run func(item) on the named lane for each item as the iterable yields it, then wait for them all.
+        No more than the lane's workers + max_pending items are pulled from the iterable ahead of completion,
+        so a generator feeding this is held back until the lane catches up.
+
+        :raises Exception: The exception raised by the iterable, or else the first raised by func, once all submitted items have finished.
+        """
+        workers = self.lanes[lane].workers
+        slots = threading.BoundedSemaphore(workers + (workers if max_pending is None else max_pending))
+        futures = []
+        try:
+            for item in iterable:
+                slots.acquire()
+                future = self.submit(lane, func, item)
+                future.add_done_callback(lambda f: slots.release())
+                futures.append(future)
+        finally:
+            # Items already submitted are waited for even if the iterable fails, so callers can clean up after them.
+            concurrent.futures.wait(futures)
+        for future in futures:
+            future.result()
+
+    def metrics(self):
+        return {name: lane.metrics() for name, lane in self.lanes.items()}
+
+    def log_metrics(self):
+        helmscanner_logging.info("Scheduler lanes | " + " | ".join(
+            f"{name}: " + ", ".join(f"{key} {value}" for key, value in metrics.items()) for name, metrics in self.metrics().items()))
+
+    def shutdown(self):
+        for lane in self.lanes.values():
+            lane.executor.shutdown(wait=True)
+
+
+scheduler = WorkScheduler()
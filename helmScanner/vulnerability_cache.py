@@ -0,0 +1,101 @@
+"""
+Vulnerability Result Cache
+==========================
+
+Persists parsed twistcli results between runs, keyed by image digest. An image whose digest was scanned within the TTL
+is neither pulled nor rescanned, and its container CSVs are written straight from the cache.
+The TTL keeps vulnerability data fresh for images which don't change, as new CVEs are published against them.
+
+Image references (tags) are also mapped to the digest they last resolved to, so a tag can be looked up before anything is pulled.
+
+:env VULN_CACHE_PATH: SQLite file holding the cache (default vulnerabilities.sqlite in the helm-scanner cache dir).
+:env VULN_CACHE_TTL_HOURS: How long scan results, and tag to digest mappings, are reused for (default 24).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from helmScanner.scannerCache import cachePath
+
+DISTRIBUTION_KEYS = ('total', 'critical', 'high', 'medium', 'low')
+
+
+class VulnerabilityCache:
+
+    def __init__(self, path, ttlSeconds):
+        self.path = path
+        self.ttlSeconds = ttlSeconds
+        # One connection per thread; WAL lets image scan threads read while another writes.
+        self.local = threading.local()
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS images (
+                    digest TEXT PRIMARY KEY,
+                    image_id TEXT NOT NULL,
+                    scanned_at REAL NOT NULL,
+                    total INTEGER, critical INTEGER, high INTEGER, medium INTEGER, low INTEGER
+                )""")
+            db.execute("CREATE TABLE IF NOT EXISTS vulnerabilities (digest TEXT NOT NULL, seq INTEGER NOT NULL, row TEXT NOT NULL, PRIMARY KEY (digest, seq))")
+            db.execute("CREATE TABLE IF NOT EXISTS refs (reference TEXT PRIMARY KEY, digest TEXT NOT NULL, resolved_at REAL NOT NULL)")
+
+    def _db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=60)
+        return db
+
+    def _fresh_since(self):
+        return time.time() - self.ttlSeconds
+
+    def digest_for(self, reference):
+        """
+        :return digest: The digest reference last resolved to within the TTL, or None.
+        """
+        row = self._db().execute("SELECT digest FROM refs WHERE reference = ? AND resolved_at >= ?", (str(reference), self._fresh_since())).fetchone()
+        return row[0] if row else None
+
+    def remember(self, reference, digest):
+        with self._db() as db:
+            db.execute("INSERT OR REPLACE INTO refs (reference, digest, resolved_at) VALUES (?, ?, ?)", (str(reference), digest, time.time()))
+
+    def get(self, digest):
+        """
+        :return image_id, distribution: The image id and vulnerability distribution of digest's last scan within the TTL, or None if there isn't one.
+        """
+        row = self._db().execute(f"SELECT image_id, {', '.join(DISTRIBUTION_KEYS)} FROM images WHERE digest = ? AND scanned_at >= ?", (digest, self._fresh_since())).fetchone()
+        if row is None:
+            return None
+        return row[0], dict(zip(DISTRIBUTION_KEYS, row[1:]))
+
+    def put(self, digest, image_id, distribution, vulnerabilities):
+        """
+        Replace the cached scan of digest.
+
+        :param vulnerabilities: Iterable of vulnerability rows (sequences of JSON-serializable values).
+        """
+        with self._db() as db:
+            db.execute("DELETE FROM vulnerabilities WHERE digest = ?", (digest,))
+            db.executemany("INSERT INTO vulnerabilities (digest, seq, row) VALUES (?, ?, ?)",
+                           ((digest, seq, json.dumps(list(row))) for seq, row in enumerate(vulnerabilities)))
+            db.execute(f"INSERT OR REPLACE INTO images (digest, image_id, scanned_at, {', '.join(DISTRIBUTION_KEYS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (digest, image_id, time.time(), *(distribution.get(key, 0) for key in DISTRIBUTION_KEYS)))
+
+    def vulnerabilities(self, digest):
+        """
+        Generator of the cached vulnerability rows for digest, as tuples in the order they were stored.
+        """
+        for (row,) in self._db().execute("SELECT row FROM vulnerabilities WHERE digest = ? ORDER BY seq", (digest,)):
+            yield tuple(json.loads(row))
+
+
+def open_cache():
+    """
+    :return cache: VulnerabilityCache at VULN_CACHE_PATH with a VULN_CACHE_TTL_HOURS TTL.
+    """
+    path = os.environ.get('VULN_CACHE_PATH') or cachePath('vulnerabilities.sqlite')
+    ttlHours = float(os.environ.get('VULN_CACHE_TTL_HOURS', default=24))
+    return VulnerabilityCache(path, ttlHours * 3600)
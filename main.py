@@ -1,4 +1,4 @@
-from helmScanner import runner
-
 if __name__ == "__main__":
+   # Imported here, since checkov worker processes import this module too and must not set up the runner.
+   from helmScanner import runner
    runner.run()
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Caches some modules open at import time go to a throwaway dir rather than the real ~/.cache/helm-scanner.
+os.environ['HELM_SCANNER_CACHE_DIR'] = tempfile.mkdtemp(prefix='helm-scanner-cache-')
@@ -0,0 +1,96 @@
+import json
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from requests.models import Response
+
+from helmScanner.collect import artifactHubCrawler
+
+
+def json_response(body, status=200, headers=None):
+    response = Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+class FakeArtifactHub:
+    """
+    Stands in for the crawler's session, serving repository and package searches from repos: {repoName: [packageName, ...]}.
+    """
+
+    def __init__(self, repos, missingPackages=()):
+        self.repos = repos
+        self.missingPackages = set(missingPackages)
+        self.requests = []
+
+    def request(self, method, url, **kwargs):
+        self.requests.append(url)
+        parsed = urlparse(url)
+        path = parsed.path[len(urlparse(artifactHubCrawler.ARTIFACTHUB_API_URL).path) + 1:]
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        if path == 'repositories/search':
+            repos = [{'name': name, 'organization_name': f'{name}-org', 'repository_id': f'id-{name}', 'digest': f'digest-{name}'} for name in self.repos]
+            offset, limit = int(query['offset']), int(query['limit'])
+            return json_response(repos[offset:offset + limit], headers={'pagination-total-count': str(len(repos))})
+        if path == 'packages/search':
+            packages = [{'name': name} for name in self.repos[query['repo']]]
+            offset, limit = int(query['offset']), int(query['limit'])
+            return json_response({'packages': packages[offset:offset + limit]}, headers={'pagination-total-count': str(len(packages))})
+        _, _, repoName, packageName = path.split('/')
+        if packageName in self.missingPackages:
+            return json_response({}, status=404)
+        return json_response({'name': packageName, 'version': '1.0.0', 'content_url': f'https://charts.example/{repoName}/{packageName}-1.0.0.tgz'})
+
+
+@pytest.fixture
+def crawler(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('ARTIFACTHUB_TOKEN', 'token')
+    monkeypatch.setenv('ARTIFACTHUB_TOKEN_SECRET', 'secret')
+    monkeypatch.setenv('CRAWL_CACHE_PATH', '')
+    monkeypatch.setenv('ARTIFACTHUB_RATE', '10000')
+    crawler = artifactHubCrawler.ArtifactHubCrawler(concurrency=4)
+    yield crawler
+    for handler in crawler.logger.handlers[-2:]:
+        crawler.logger.removeHandler(handler)
+        handler.close()
+
+
+def use_fake(crawler, fake):
+    crawler.scheduler.session = fake
+    return fake
+
+
+def test_crawl_stream_resolves_every_package_across_pages(crawler):
+    use_fake(crawler, FakeArtifactHub({'big': [f'chart{n}' for n in range(130)], 'small': ['nginx']}))
+
+    repos = {repo['repoName']: repo for repo in crawler.crawl_stream()}
+
+    assert set(repos) == {'big', 'small'}
+    assert [package['name'] for package in repos['big']['repoPackages']] == [f'chart{n}' for n in range(130)]
+    assert repos['big']['repoTotalPackages'] == 130
+    assert repos['small']['repoOrgName'] == 'small-org'
+    assert repos['small']['repoRaw']['digest'] == 'digest-small'
+    assert crawler.totalRepos == 2
+    assert crawler.totalPackages == 131
+
+
+def test_crawl_skips_packages_whose_details_fail(crawler):
+    use_fake(crawler, FakeArtifactHub({'repo': ['good', 'gone']}, missingPackages={'gone'}))
+
+    repos = list(crawler.crawl_stream())
+
+    assert [package['name'] for package in repos[0]['repoPackages']] == ['good']
+    assert repos[0]['repoTotalPackages'] == 2
+
+
+def test_crawl_orders_repos_by_search_position(crawler):
+    use_fake(crawler, FakeArtifactHub({name: ['chart'] for name in ('a', 'b', 'c')}))
+
+    crawlDict, totalRepos, totalPackages = crawler.crawl()
+
+    assert [repo['repoName'] for repo in crawlDict.values()] == ['a', 'b', 'c']
+    assert list(crawlDict) == [1, 2, 3]
+    assert (totalRepos, totalPackages) == (3, 3)
@@ -0,0 +1,87 @@
+import concurrent.futures
+import threading
+
+from helmScanner.collect.chart_cache import ChartCache
+from helmScanner.collect.chart_downloader import ChartDownloader
+
+
+class FakeDownloader:
+    """
+    Writes each url's bytes instead of downloading it, counting downloads per url. Downloads of a url in block wait for its event.
+    """
+
+    def __init__(self, block=None):
+        self.block = block or {}
+        self.downloads = {}
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+    def download(self, url, path):
+        with self.lock:
+            self.downloads[url] = self.downloads.get(url, 0) + 1
+        if url in self.block:
+            self.block[url].wait(5)
+        with open(path, 'wb') as f:
+            f.write(url.encode())
+        return len(url)
+
+    def submit(self, url, func, *args):
+        return self.executor.submit(func, *args)
+
+
+def test_concurrent_checkouts_share_one_download(tmp_path):
+    release = threading.Event()
+    downloader = FakeDownloader(block={'https://charts.example/a.tgz': release})
+    cache = ChartCache(str(tmp_path), 1024, downloader)
+
+    first = cache.checkout('https://charts.example/a.tgz', '1.0.0')
+    second = cache.checkout('https://charts.example/a.tgz', '1.0.0')
+    release.set()
+    with first as firstPath, second as secondPath:
+        assert firstPath == secondPath
+    with cache.checkout('https://charts.example/a.tgz', '1.0.0') as path:
+        assert open(path, 'rb').read() == b'https://charts.example/a.tgz'
+
+    assert downloader.downloads == {'https://charts.example/a.tgz': 1}
+
+
+def test_cache_survives_restart_and_evicts_least_recently_used(tmp_path):
+    cache = ChartCache(str(tmp_path), 60, FakeDownloader())
+    for name in ('a', 'b', 'c'):
+        with cache.checkout(f'https://charts.example/{name}.tgz'):
+            pass
+
+    restarted = ChartCache(str(tmp_path), 60, FakeDownloader())
+
+    assert list(restarted.entries) == [ChartCache.key(f'https://charts.example/{name}.tgz') for name in ('b', 'c')]
+
+
+def test_failed_download_is_retried_by_the_next_checkout(tmp_path):
+    downloader = FakeDownloader()
+    cache = ChartCache(str(tmp_path), 1024, downloader)
+    download = downloader.download
+    downloader.download = lambda url, path: (_ for _ in ()).throw(IOError('connection reset'))
+
+    checkout = cache.checkout('https://charts.example/a.tgz')
+    try:
+        with checkout:
+            pass
+    except IOError:
+        pass
+    downloader.download = download
+
+    with cache.checkout('https://charts.example/a.tgz') as path:
+        assert open(path, 'rb').read() == b'https://charts.example/a.tgz'
+
+
+def test_slow_host_does_not_hold_up_other_hosts():
+    downloader = ChartDownloader(hostConcurrency=1)
+    release = threading.Event()
+
+    slow = [downloader.submit('https://slow.example/a.tgz', release.wait, 5) for _ in range(3)]
+    fast = [downloader.submit('https://fast.example/a.tgz', lambda n=n: n) for n in range(20)]
+
+    assert [future.result(timeout=2) for future in fast] == list(range(20))
+    assert not any(future.done() for future in slow)
+    release.set()
+    assert all(future.result(timeout=2) for future in slow)
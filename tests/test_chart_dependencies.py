@@ -0,0 +1,79 @@
+import io
+import tarfile
+
+import pytest
+import yaml
+
+from helmScanner.chart_dependencies import _version_matches, chart_dependencies
+from helmScanner.collect.chart_extractor import extract_archive
+
+
+def _tar(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def _chart_yaml(name, version, dependencies=None):
+    chart = {'apiVersion': 'v2', 'name': name, 'version': version}
+    if dependencies:
+        chart['dependencies'] = dependencies
+    return yaml.safe_dump(chart).encode()
+
+
+def _extract_sample(tmp_path, dependencies, subcharts):
+    """
+    Packages an 'app' chart with the given dependencies and charts/ members, then extracts it the way the scanner does.
+    """
+    files = {'app/Chart.yaml': _chart_yaml('app', '0.1.0', dependencies)}
+    for name, data in subcharts.items():
+        files[f'app/charts/{name}'] = data
+    extract_archive(io.BytesIO(_tar(files)), str(tmp_path))
+    return str(tmp_path / 'app')
+
+
+def test_packaged_subchart_is_ok_after_extraction(tmp_path):
+    redis = _tar({'redis/Chart.yaml': _chart_yaml('redis', '12.1.0')})
+    chartPath = _extract_sample(tmp_path, [
+        {'name': 'redis', 'version': '~12.1.0', 'repository': 'https://charts.example'},
+    ], {'redis-12.1.0.tgz': redis})
+
+    assert chart_dependencies(chartPath) == {'redis': {
+        'chart_name': 'redis',
+        'chart_version': '~12.1.0',
+        'chart_repo': 'https://charts.example',
+        'chart_status': 'ok'}}
+
+
+def test_dependency_statuses(tmp_path):
+    chartPath = _extract_sample(tmp_path, [
+        {'name': 'common', 'version': '1.x'},
+        {'name': 'redis', 'version': '>=v13.0.0'},
+        {'name': 'postgresql', 'version': '10.0.0'},
+    ], {
+        'common/Chart.yaml': _chart_yaml('common', '1.4.2'),
+        'redis-12.1.0.tgz': _tar({'redis/Chart.yaml': _chart_yaml('redis', '12.1.0')}),
+    })
+
+    statuses = {name: dep['chart_status'] for name, dep in chart_dependencies(chartPath).items()}
+    assert statuses == {'common': 'unpacked', 'redis': 'wrong version', 'postgresql': 'missing'}
+
+
+def test_chart_without_chart_yaml_has_no_dependencies(tmp_path):
+    assert chart_dependencies(str(tmp_path)) == {}
+
+
+@pytest.mark.parametrize('constraint, version, matches', [
+    ('1.2.3', '1.2.3', True),
+    ('>=v1.2.0 <v2', '1.5.0', True),
+    ('~v1.2', 'v1.2.9', True),
+    ('>=1.0.0, <2.0.0', '2.0.0', False),
+    ('^1.0.0-rev1', '1.0.0', True),
+    ('not a constraint', '1.0.0', None),
+])
+def test_version_matches(constraint, version, matches):
+    assert _version_matches(constraint, version) is matches
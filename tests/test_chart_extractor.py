@@ -0,0 +1,72 @@
+import io
+import os
+import tarfile
+
+from helmScanner.collect.chart_extractor import extract_archive
+
+
+def _tar(files, mode='w:gz'):
+    """
+    :return archive: Bytes of a tar holding files, a dict of member name to bytes.
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def test_every_file_is_extracted(tmp_path):
+    archive = _tar({
+        'app/Chart.yaml': b'name: app\n',
+        'app/README.md': b'# app\n',
+        'app/files/logo.png': b'\x89PNG',
+    })
+
+    assert extract_archive(io.BytesIO(archive), str(tmp_path)) == 3
+    assert (tmp_path / 'app' / 'README.md').read_bytes() == b'# app\n'
+    assert (tmp_path / 'app' / 'files' / 'logo.png').read_bytes() == b'\x89PNG'
+
+
+def test_nested_archives_are_kept_and_unpacked(tmp_path):
+    subchart = _tar({'sub/Chart.yaml': b'name: sub\nversion: 1.2.3\n'})
+    archive = _tar({
+        'app/Chart.yaml': b'name: app\n',
+        'app/charts/sub-1.2.3.tgz': subchart,
+    })
+
+    assert extract_archive(io.BytesIO(archive), str(tmp_path)) == 3
+    assert (tmp_path / 'app' / 'charts' / 'sub-1.2.3.tgz').read_bytes() == subchart
+    assert (tmp_path / 'app' / 'charts' / 'sub' / 'Chart.yaml').is_file()
+
+
+def test_corrupt_nested_archive_is_kept_packaged(tmp_path):
+    archive = _tar({
+        'app/Chart.yaml': b'name: app\n',
+        'app/charts/sub-1.2.3.tgz': b'not a tar',
+    })
+
+    assert extract_archive(io.BytesIO(archive), str(tmp_path)) == 2
+    assert (tmp_path / 'app' / 'charts' / 'sub-1.2.3.tgz').read_bytes() == b'not a tar'
+
+
+def test_unsafe_members_are_skipped(tmp_path):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name in ('../escape.yaml', '/abs.yaml', 'app/Chart.yaml'):
+            info = tarfile.TarInfo(name)
+            info.size = 1
+            tar.addfile(info, io.BytesIO(b'x'))
+        link = tarfile.TarInfo('app/link')
+        link.type = tarfile.SYMTYPE
+        link.linkname = '/etc/passwd'
+        tar.addfile(link)
+    extractPath = tmp_path / 'out'
+    extractPath.mkdir()
+
+    assert extract_archive(io.BytesIO(buffer.getvalue()), str(extractPath)) == 1
+    assert not (tmp_path / 'escape.yaml').exists()
+    assert os.listdir(str(extractPath)) == ['app']
+    assert os.listdir(str(extractPath / 'app')) == ['Chart.yaml']
@@ -0,0 +1,50 @@
+import os
+import stat
+
+import pytest
+
+from helmScanner import chart_renderer
+from helmScanner.chart_renderer import RenderCache
+
+# Stands in for helm: renders only with --dependency-update, as for a chart whose dependencies aren't bundled, and logs each call.
+FAKE_HELM = """#!/bin/sh
+echo "$@" >> "$HELM_CALLS"
+case "$*" in
+  *--dependency-update*) echo "# Source: app/templates/service.yaml"; echo "kind: Service" ;;
+  *) echo "Error: found in Chart.yaml, but missing in charts/ directory: redis" >&2; exit 1 ;;
+esac
+"""
+
+
+@pytest.fixture
+def helm(tmp_path, monkeypatch):
+    binPath = tmp_path / 'bin'
+    binPath.mkdir()
+    helmPath = binPath / 'helm'
+    helmPath.write_text(FAKE_HELM)
+    helmPath.chmod(helmPath.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f"{binPath}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv('HELM_CALLS', str(tmp_path / 'calls'))
+    monkeypatch.setattr(chart_renderer, 'renderCache', RenderCache(str(tmp_path / 'cache'), 1024 * 1024))
+    return tmp_path / 'calls'
+
+
+def _chart(tmp_path, version='0.1.0'):
+    chartPath = tmp_path / 'app'
+    chartPath.mkdir(exist_ok=True)
+    (chartPath / 'Chart.yaml').write_text(f"apiVersion: v2\nname: app\nversion: {version}\n")
+    return str(chartPath)
+
+
+def test_unbundled_dependencies_are_fetched_and_the_render_cached(tmp_path, helm):
+    chartPath = _chart(tmp_path)
+
+    assert chart_renderer.render(chartPath) == "# Source: app/templates/service.yaml\nkind: Service\n"
+    assert chart_renderer.render(chartPath) == "# Source: app/templates/service.yaml\nkind: Service\n"
+    assert helm.read_text().splitlines() == [f"template {chartPath}", f"template {chartPath} --dependency-update"]
+
+
+def test_charts_that_fail_to_render_give_none(tmp_path, helm, monkeypatch):
+    monkeypatch.setattr(chart_renderer, '_helm_template', lambda chartPath, *flags: (None, 'Error: parse error'))
+
+    assert chart_renderer.render(_chart(tmp_path, '0.2.0')) is None
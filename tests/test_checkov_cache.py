@@ -0,0 +1,42 @@
+from helmScanner import checkov_cache
+from helmScanner.checkov_cache import CheckovCache
+
+RENDERED = "# Source: app/templates/service.yaml\napiVersion: v1\nkind: Service\nmetadata:\n  name: app\n"
+RESULTS = {
+    'passed': [['CKV_K8S_21', 'The default namespace should not be used', 'CheckResult.PASSED', '/app/templates/service.yaml',
+                'checkov.kubernetes.checks.DefaultNamespace', 'Service.app.default']],
+    'failed': [],
+    'summary': {'passed': 1, 'failed': 0, 'parsing_errors': 0},
+    'empty': False,
+}
+
+
+def test_results_round_trip_across_opens(tmp_path):
+    path = str(tmp_path / 'checkov.sqlite')
+    CheckovCache(path, 'fingerprint').put(RENDERED, RESULTS)
+
+    assert CheckovCache(path, 'fingerprint').get(RENDERED) == RESULTS
+    assert CheckovCache(path, 'fingerprint').get(RENDERED + "  labels: {}\n") is None
+
+
+def test_a_new_fingerprint_misses(tmp_path):
+    path = str(tmp_path / 'checkov.sqlite')
+    CheckovCache(path, 'checkov 2.0.263').put(RENDERED, RESULTS)
+
+    assert CheckovCache(path, 'checkov 2.0.264').get(RENDERED) is None
+
+
+def test_a_new_results_format_misses(tmp_path, monkeypatch):
+    path = str(tmp_path / 'checkov.sqlite')
+    CheckovCache(path, 'fingerprint').put(RENDERED, RESULTS)
+    monkeypatch.setattr(checkov_cache, 'RESULTS_FORMAT', checkov_cache.RESULTS_FORMAT + 1)
+
+    assert CheckovCache(path, 'fingerprint').get(RENDERED) is None
+
+
+def test_empty_renders_are_not_cached(tmp_path):
+    cache = CheckovCache(str(tmp_path / 'checkov.sqlite'), 'fingerprint')
+    cache.put('', dict(RESULTS, empty=True))
+
+    assert cache.get('') is None
+    assert cache.db.execute("SELECT COUNT(*) FROM results").fetchone() == (0,)
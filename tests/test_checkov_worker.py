@@ -0,0 +1,54 @@
+from helmScanner import checkov_worker
+from helmScanner.chart_renderer import write_manifests
+
+# `helm template` output for a small chart: a Service and a Deployment, each from its own template.
+RENDERED = """---
+# Source: app/templates/service.yaml
+apiVersion: v1
+kind: Service
+metadata:
+  name: app
+spec:
+  ports:
+    - port: 80
+  selector:
+    app: app
+---
+# Source: app/templates/deployment.yaml
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: app
+spec:
+  selector:
+    matchLabels:
+      app: app
+  template:
+    metadata:
+      labels:
+        app: app
+    spec:
+      containers:
+        - name: app
+          image: nginx:1.21
+"""
+
+
+def test_write_manifests_splits_by_source(tmp_path):
+    manifestPath = write_manifests(RENDERED, str(tmp_path / 'manifests'))
+
+    assert sorted(path.name for path in (tmp_path / 'manifests' / 'app' / 'templates').iterdir()) == ['deployment.yaml', 'service.yaml']
+    assert manifestPath == str(tmp_path / 'manifests')
+
+
+def test_rendered_manifests_are_scanned_under_a_hidden_directory(tmp_path):
+    # Checkov skips files under '/.' paths when it walks a folder itself; the default cache and scratch dirs can be under one.
+    manifestPath = write_manifests(RENDERED, str(tmp_path / '.scratch' / 'manifests'))
+
+    results = checkov_worker.scan_manifests(manifestPath)
+
+    assert not results['empty']
+    assert results['summary']['passed'] > 0 and results['summary']['failed'] > 0
+    assert results['summary']['passed'] == len(results['passed'])
+    filePaths = {check[checkov_worker.CHECK_FIELDS.index('file_path')] for check in results['passed'] + results['failed']}
+    assert filePaths == {'/app/templates/deployment.yaml', '/app/templates/service.yaml'}
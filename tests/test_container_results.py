@@ -0,0 +1,82 @@
+import csv
+
+import pytest
+
+from helmScanner.output import container_results
+from helmScanner.output.container_results import ContainerResultsWriter
+
+VULNERABILITY_COLUMNS = ['CVE', 'Severity']
+
+
+class FakeUploadQueue:
+
+    def __init__(self):
+        self.enqueued = []
+
+    def enqueue(self, path):
+        self.enqueued.append(path)
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    uploads = FakeUploadQueue()
+    monkeypatch.setattr(container_results, 'uploadQueue', uploads)
+    return uploads
+
+
+def _summary(image):
+    return ['20210101', 'bitnami', image, '1.0', 'sha256:abc', 1, 0, 1, 0, 0]
+
+
+def _vulnerabilities(image, cves):
+    for cve in cves:
+        if isinstance(cve, Exception):
+            raise cve
+        yield ['20210101', 'bitnami', image, '1.0', 'sha256:abc', cve, 'high']
+
+
+def _read(path):
+    with open(path, newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_rows_are_written_and_files_uploaded_on_close(tmp_path, uploads):
+    writer = ContainerResultsWriter(str(tmp_path), VULNERABILITY_COLUMNS, 1024 * 1024)
+    writer.put(_summary('redis'), _vulnerabilities('redis', ['CVE-1', 'CVE-2']))
+    writer.put(_summary('nginx'), _vulnerabilities('nginx', []))
+    writer.close()
+
+    summaries, vulnerabilities = sorted(uploads.enqueued)
+    assert summaries.endswith('container_summaries/container-summaries-0001.csv')
+    assert [row[2] for row in _read(summaries)[1:]] == ['redis', 'nginx']
+    rows = _read(vulnerabilities)
+    assert rows[0] == container_results.IMAGE_COLUMNS + VULNERABILITY_COLUMNS
+    assert [row[5] for row in rows[1:]] == ['CVE-1', 'CVE-2']
+
+
+def test_an_image_failing_part_way_writes_none_of_its_rows(tmp_path, uploads):
+    writer = ContainerResultsWriter(str(tmp_path), VULNERABILITY_COLUMNS, 1024 * 1024)
+    writer.put(_summary('redis'), _vulnerabilities('redis', ['CVE-1', ValueError('truncated scan'), 'CVE-3']))
+    writer.put(_summary('nginx'), _vulnerabilities('nginx', ['CVE-4']))
+    writer.close()
+
+    summaries, vulnerabilities = sorted(uploads.enqueued)
+    assert [row[2] for row in _read(summaries)[1:]] == ['nginx']
+    assert [row[5] for row in _read(vulnerabilities)[1:]] == ['CVE-4']
+
+
+def test_files_roll_over_at_max_size(tmp_path, uploads):
+    writer = ContainerResultsWriter(str(tmp_path), VULNERABILITY_COLUMNS, 1)
+    for image in ('redis', 'nginx', 'mysql'):
+        writer.put(_summary(image), _vulnerabilities(image, ['CVE-1']))
+    writer.close()
+
+    assert len(uploads.enqueued) == 6
+    assert sorted(path[-8:] for path in uploads.enqueued if 'summaries' in path) == ['0001.csv', '0002.csv', '0003.csv']
+
+
+def test_close_without_writes_does_nothing(tmp_path, uploads):
+    writer = ContainerResultsWriter(str(tmp_path), VULNERABILITY_COLUMNS, 1024)
+    writer.close()
+
+    assert uploads.enqueued == []
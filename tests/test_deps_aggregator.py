@@ -0,0 +1,36 @@
+import pandas as pd
+
+from helmScanner.output import row_store
+from helmScanner.output.deps_aggregator import DepsAggregator
+
+
+def _deps_table(chart, deps):
+    table = row_store.dep_store()
+    metaId = table.meta(['20210101', chart, chart.split('/')[0], chart.split('/')[1], '1.0.0'])
+    for dep in deps:
+        table.append(metaId, [dep, '1.x', 'https://charts.example', 'ok'])
+    return table
+
+
+def test_merges_organisations_into_global_tables(tmp_path):
+    aggregator = DepsAggregator(str(tmp_path), checkpointSeconds=0)
+    assert aggregator.add(_deps_table('bitnami/wordpress', ['mariadb', 'common'])) == []
+    assert aggregator.add(_deps_table('other/blog', ['mariadb'])) == []
+
+    tablePath, listPath = aggregator.write()
+    usage = pd.read_csv(tablePath, index_col=0)
+    assert usage['charts'].to_dict() == {'mariadb': 2, 'common': 1}
+    dependants = pd.read_csv(listPath, index_col=0)
+    assert sorted(dependants['mariadb'].dropna()) == ['bitnami/wordpress', 'other/blog']
+    assert list(dependants['common'].dropna()) == ['bitnami/wordpress']
+
+
+def test_checkpoints_only_when_due(tmp_path):
+    aggregator = DepsAggregator(str(tmp_path), checkpointSeconds=3600)
+    assert aggregator.add(_deps_table('bitnami/wordpress', ['mariadb'])) == []
+
+    aggregator.lastWrite -= 3600
+    paths = aggregator.add(_deps_table('other/blog', ['mariadb']))
+    assert paths == [f'{tmp_path}/global-deps-table.csv', f'{tmp_path}/global-deps-list.csv']
+    assert pd.read_csv(paths[0], index_col=0)['charts'].to_dict() == {'mariadb': 2}
+    assert aggregator.add(_deps_table('third/app', ['redis'])) == []
@@ -0,0 +1,73 @@
+import pytest
+
+from helmScanner.image_references import ImageReference, image_references, parse_image_reference
+
+DIGEST = 'sha256:' + 'a' * 64
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('nginx', ImageReference('docker.io', 'library/nginx', 'latest', None)),
+    ('bitnami/redis:6.2', ImageReference('docker.io', 'bitnami/redis', '6.2', None)),
+    ('docker.io/nginx:1.21', ImageReference('docker.io', 'library/nginx', '1.21', None)),
+    ('index.docker.io/library/nginx', ImageReference('docker.io', 'library/nginx', 'latest', None)),
+    ('registry:5000/team/app:1.2', ImageReference('registry:5000', 'team/app', '1.2', None)),
+    ('localhost/app', ImageReference('localhost', 'app', 'latest', None)),
+    (f'quay.io/org/app@{DIGEST}', ImageReference('quay.io', 'org/app', None, DIGEST)),
+    (f'"ghcr.io/org/app:v1@{DIGEST}"', ImageReference('ghcr.io', 'org/app', 'v1', DIGEST)),
+])
+def test_parse_image_reference(value, expected):
+    assert parse_image_reference(value) == expected
+
+
+@pytest.mark.parametrize('value', [
+    None, '', 'nginx latest', 'Nginx', 'app:', 'app:bad/tag', 'app@sha256:short', '{{ .Values.image }}',
+])
+def test_invalid_references_are_dropped(value):
+    assert parse_image_reference(value) is None
+
+
+def test_str_uses_the_familiar_name():
+    assert str(parse_image_reference('docker.io/library/nginx:1.21')) == 'nginx:1.21'
+    assert str(parse_image_reference('registry:5000/team/app')) == 'registry:5000/team/app:latest'
+    assert parse_image_reference(f'app@{DIGEST}').version == DIGEST
+
+
+def test_image_references_reads_every_pod_spec():
+    rendered = """
+---
+apiVersion: apps/v1
+kind: Deployment
+spec:
+  template:
+    spec:
+      initContainers:
+        - name: init
+          image: busybox:1.33
+      containers:
+        - name: app
+          image: bitnami/redis:6.2
+        - name: sidecar
+          image: "nginx"
+---
+apiVersion: batch/v1beta1
+kind: CronJob
+spec:
+  jobTemplate:
+    spec:
+      template:
+        spec:
+          containers:
+            - name: job
+              image: docker.io/bitnami/redis:6.2
+            - name: broken
+              image: not valid
+---
+this: [is not yaml
+---
+apiVersion: v1
+kind: ConfigMap
+data:
+  image: ignored:1.0
+"""
+
+    assert [str(reference) for reference in image_references(rendered)] == ['busybox:1.33', 'bitnami/redis:6.2', 'nginx:latest']
@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+
+import pytest
+
+from helmScanner import image_scanner
+from helmScanner.image_references import parse_image_reference
+from helmScanner.image_scanner import ImageScanner
+
+DIGEST = 'sha256:' + 'c' * 64
+
+
+class FakeImage:
+    id = 'sha256:' + 'd' * 64
+    attrs = {'RepoDigests': [f'redis@{DIGEST}']}
+
+
+class FakeVulnerabilityCache:
+
+    def __init__(self, failOnRemember=False):
+        self.failOnRemember = failOnRemember
+
+    def get(self, digest):
+        return None
+
+    def digest_for(self, image_reference):
+        return None
+
+    def remember(self, image_reference, digest):
+        if self.failOnRemember:
+            raise sqlite3.OperationalError('database is locked')
+
+
+def _scanner(vulnCache, resolvedDigests=None):
+    # Built without __init__, which needs docker, twistcli and a Bridgecrew API key.
+    scanner = ImageScanner.__new__(ImageScanner)
+    scanner.registryLock = threading.Lock()
+    scanner.scansByReference = {}
+    scanner.scansByDigest = {}
+    scanner.resolvedDigests = dict(resolvedDigests or {})
+    scanner.vulnCache = vulnCache
+    return scanner
+
+
+@pytest.fixture(autouse=True)
+def no_docker(monkeypatch):
+    monkeypatch.setattr(image_scanner.docker, 'from_env', lambda: None)
+
+
+def test_failed_pull_releases_images_waiting_on_the_digest():
+    reference = parse_image_reference('redis:6.2')
+    scanner = _scanner(FakeVulnerabilityCache(), {reference: DIGEST})
+
+    def pull(docker_cli, image_reference, digest):
+        raise RuntimeError('pull lane failed')
+    scanner._pull = pull
+
+    with pytest.raises(RuntimeError):
+        scanner._pull_and_scan(reference)
+    assert scanner.scansByDigest[DIGEST].result(timeout=1) is None
+
+
+def test_cache_errors_after_the_pull_release_images_waiting_on_the_digest():
+    reference = parse_image_reference('redis:6.2')
+    scanner = _scanner(FakeVulnerabilityCache(failOnRemember=True))
+    scanner._pull = lambda docker_cli, image_reference, digest: (FakeImage(), str(image_reference))
+
+    with pytest.raises(sqlite3.OperationalError):
+        scanner._pull_and_scan(reference)
+    assert scanner.scansByDigest[DIGEST].result(timeout=1) is None
+
+
+def test_images_sharing_a_digest_are_scanned_once():
+    first, second = parse_image_reference('redis:6.2'), parse_image_reference('redis:6')
+    scanner = _scanner(FakeVulnerabilityCache(), {first: DIGEST, second: DIGEST})
+    scanner._pull = lambda docker_cli, image_reference, digest: (FakeImage(), str(image_reference))
+    scans = []
+
+    def twistcli_scan(img, docker_image_id, digest):
+        scans.append(docker_image_id)
+        return image_scanner.ImageScanResult(img.id, digest, {'total': 0})
+    scanner._twistcli_scan = twistcli_scan
+
+    assert scanner._pull_and_scan(first) == scanner._pull_and_scan(second)
+    assert scans == ['redis:6.2']
@@ -0,0 +1,106 @@
+from helmScanner.image_store import ImageStore
+
+
+class FakeImage:
+
+    def __init__(self, id, size):
+        self.id = id
+        self.attrs = {'Size': size}
+
+
+class FakeImages:
+
+    def __init__(self, docker_cli):
+        self.docker_cli = docker_cli
+        self.removed = []
+
+    def remove(self, image_id, **kwargs):
+        assert not kwargs.get('force')
+        if image_id in self.docker_cli.inUse:
+            raise RuntimeError('image is being used by a running container')
+        self.removed.append(image_id)
+        self.docker_cli.layers.pop(image_id, None)
+
+
+class FakeDockerClient:
+    """
+    Reports layer storage as the sum of each present image's unique layers, as `docker system df` would.
+    """
+
+    def __init__(self, layers=None):
+        self.layers = dict(layers or {})
+        self.inUse = set()
+        self.images = FakeImages(self)
+        self.dfCalls = 0
+
+    def df(self):
+        self.dfCalls += 1
+        return {'LayersSize': sum(self.layers.values())}
+
+
+def _pull(store, docker_cli, image_id, size, uniqueSize=None):
+    docker_cli.layers[image_id] = size if uniqueSize is None else uniqueSize
+    store.track(FakeImage(image_id, size), image_id)
+
+
+def test_host_images_are_never_evicted():
+    docker_cli = FakeDockerClient({'host-image': 100})
+    store = ImageStore(docker_cli, maxBytes=50)
+
+    store.track(FakeImage('host-image', 100), 'host-image', pulled=False)
+    _pull(store, docker_cli, 'pulled', 10)
+
+    assert docker_cli.images.removed == ['pulled']
+    assert 'host-image' in docker_cli.layers
+
+
+def test_evicts_least_recently_used_unpinned_images():
+    docker_cli = FakeDockerClient()
+    store = ImageStore(docker_cli, maxBytes=25)
+    _pull(store, docker_cli, 'a', 10)
+    _pull(store, docker_cli, 'b', 10)
+    store.track(FakeImage('a', 10), 'a', pulled=False)
+    store.pin(['b'])
+
+    _pull(store, docker_cli, 'c', 10)
+    assert docker_cli.images.removed == ['a']
+
+    store.unpin(['b'])
+    _pull(store, docker_cli, 'd', 10)
+    assert docker_cli.images.removed == ['a', 'b']
+
+
+def test_measures_again_after_each_removal():
+    # Each image reports 10 bytes, but shares most of its layers, so removing one frees far less than its size.
+    docker_cli = FakeDockerClient()
+    store = ImageStore(docker_cli, maxBytes=8)
+    store.pin(['a', 'b', 'c'])
+    _pull(store, docker_cli, 'a', 10, uniqueSize=5)
+    _pull(store, docker_cli, 'b', 10, uniqueSize=5)
+    _pull(store, docker_cli, 'c', 10, uniqueSize=5)
+    store.unpin(['a', 'b', 'c'])
+
+    assert docker_cli.images.removed == ['a', 'b']
+
+
+def test_images_in_use_are_left_to_docker():
+    docker_cli = FakeDockerClient()
+    docker_cli.inUse.add('a')
+    store = ImageStore(docker_cli, maxBytes=15)
+    store.pin(['b'])
+    _pull(store, docker_cli, 'a', 10)
+    _pull(store, docker_cli, 'b', 10)
+
+    assert docker_cli.images.removed == []
+    assert list(store.images) == ['b']
+
+
+def test_usage_is_not_measured_on_every_use_while_under_budget():
+    docker_cli = FakeDockerClient()
+    store = ImageStore(docker_cli, maxBytes=1000, measureInterval=3600)
+    for image_id in ('a', 'b', 'c'):
+        _pull(store, docker_cli, image_id, 10)
+        store.pin([image_id])
+        store.unpin([image_id])
+
+    assert docker_cli.dfCalls == 1
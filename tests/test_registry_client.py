@@ -0,0 +1,87 @@
+import pytest
+import requests
+
+from helmScanner.image_references import parse_image_reference
+from helmScanner.registry_client import RegistryClient
+
+DIGEST = 'sha256:' + 'b' * 64
+CHALLENGE = 'Bearer realm="https://auth.example/token",service="registry.example",scope="repository:team/app:pull"'
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, headers=None, body=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = headers or {}
+        self.body = body
+
+    def json(self):
+        if isinstance(self.body, Exception):
+            raise self.body
+        return self.body
+
+
+class FakeSession:
+    """
+    Answers manifest HEADs with a 401 challenge unless the expected bearer token is sent, and token GETs with tokenResponse.
+    """
+
+    def __init__(self, tokenResponse):
+        self.tokenResponse = tokenResponse
+        self.tokenRequests = 0
+
+    def head(self, url, headers, timeout):
+        if headers.get('Authorization') != 'Bearer good-token':
+            return FakeResponse(401, {'WWW-Authenticate': CHALLENGE})
+        return FakeResponse(200, {'Docker-Content-Digest': DIGEST})
+
+    def get(self, url, params, timeout):
+        self.tokenRequests += 1
+        return self.tokenResponse
+
+
+def _client(tokenResponse):
+    client = RegistryClient(insecureRegistries=[], concurrency=2, timeout=1)
+    client.session = FakeSession(tokenResponse)
+    return client
+
+
+def test_resolves_with_an_anonymous_token_and_caches_it():
+    client = _client(FakeResponse(body={'token': 'good-token', 'expires_in': 300}))
+    reference = parse_image_reference('registry.example/team/app:1.0')
+
+    assert client.resolve_digest(reference) == DIGEST
+    assert client.resolve_digest(reference) == DIGEST
+    assert client.session.tokenRequests == 1
+
+
+@pytest.mark.parametrize('body', [
+    ValueError('not json'),
+    ['not', 'a', 'dict'],
+    {'token': 'good-token', 'expires_in': 'soon'},
+    {'expires_in': 300},
+])
+def test_malformed_token_response_means_unresolved(body):
+    client = _client(FakeResponse(body=body))
+
+    assert client.resolve_digest(parse_image_reference('registry.example/team/app:1.0')) is None
+    assert client.tokens == {}
+
+
+def test_connection_errors_mean_unresolved():
+    client = _client(None)
+
+    def head(url, headers, timeout):
+        raise requests.exceptions.ConnectionError('refused')
+    client.session.head = head
+
+    assert client.resolve_digest(parse_image_reference('registry.example/team/app:1.0')) is None
+
+
+def test_digest_references_need_no_request():
+    client = _client(None)
+    reference = parse_image_reference(f'registry.example/team/app@{DIGEST}')
+
+    assert client.resolve_all([reference]) == {reference: DIGEST}
+    assert client.session.tokenRequests == 0
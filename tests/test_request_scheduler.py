@@ -0,0 +1,127 @@
+import email.utils
+import time
+
+import pytest
+import requests
+from requests.models import Response
+
+from helmScanner.collect.request_scheduler import RequestScheduler, retry_after_seconds
+
+
+def response(status=200, headers=None):
+    response = Response()
+    response.status_code = status
+    response._content = b''
+    response.headers.update(headers or {})
+    response.closed = False
+
+    def close():
+        response.closed = True
+    response.close = close
+    return response
+
+
+class FakeSession:
+    """
+    Returns (or raises) each of outcomes in turn.
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def scheduler(session, **kwargs):
+    kwargs.setdefault('rate', 1000)
+    kwargs.setdefault('backoffBase', 0)
+    return RequestScheduler(session, **kwargs)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (None, None),
+    ('', None),
+    ('3', 3),
+    ('1.5', 1.5),
+    ('-4', 0),
+    ('soon', None),
+    ('Wed, 21 Oct 2015 07:28:00 GMT', 0),
+])
+def test_retry_after_seconds(value, expected):
+    headers = {'Retry-After': value} if value is not None else {}
+    assert retry_after_seconds(response(429, headers)) == expected
+
+
+def test_retry_after_seconds_http_date():
+    retryAt = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 25 < retry_after_seconds(response(429, {'Retry-After': retryAt})) <= 30
+
+
+def test_retries_server_errors_until_success():
+    failed = response(503)
+    session = FakeSession(failed, response(200))
+
+    result = scheduler(session).get('https://artifacthub.example/api')
+
+    assert result.status_code == 200
+    assert session.calls == 2
+    assert failed.closed
+
+
+def test_returns_last_response_when_retries_run_out():
+    session = FakeSession(response(502), response(502))
+
+    result = scheduler(session, maxRetries=1).get('https://artifacthub.example/api')
+
+    assert result.status_code == 502
+    assert not result.closed
+
+
+def test_does_not_retry_client_errors():
+    session = FakeSession(response(404))
+
+    assert scheduler(session).get('https://artifacthub.example/api').status_code == 404
+    assert session.calls == 1
+
+
+def test_throttling_halves_concurrency_and_pauses_callers():
+    session = FakeSession(response(429, {'Retry-After': '0.2'}), response(200))
+    requestScheduler = scheduler(session, maxConcurrency=8)
+
+    started = time.monotonic()
+    requestScheduler.get('https://artifacthub.example/api')
+
+    assert time.monotonic() - started >= 0.2
+    assert int(requestScheduler.limit) == 4
+
+
+def test_connection_errors_are_retried_without_growing_the_limit():
+    session = FakeSession(requests.exceptions.ConnectionError(), requests.exceptions.Timeout())
+    requestScheduler = scheduler(session, maxConcurrency=4, maxRetries=1)
+    requestScheduler.limit = 2.0
+
+    with pytest.raises(requests.exceptions.Timeout):
+        requestScheduler.get('https://artifacthub.example/api')
+
+    assert session.calls == 2
+    assert requestScheduler.limit == 2.0
+    assert requestScheduler.inFlight == 0
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.ChunkedEncodingError(), requests.exceptions.TooManyRedirects(), requests.exceptions.InvalidURL(), ValueError()])
+def test_other_errors_raise_and_release_their_slot(error):
+    session = FakeSession(error, response(200))
+    requestScheduler = scheduler(session, maxConcurrency=1)
+
+    with pytest.raises(type(error)):
+        requestScheduler.get('https://artifacthub.example/api')
+
+    assert requestScheduler.inFlight == 0
+    # With its only slot leaked this would wait forever.
+    assert requestScheduler.get('https://artifacthub.example/api').status_code == 200
@@ -0,0 +1,49 @@
+from helmScanner.output import row_store
+from helmScanner.output.row_store import RowStore
+
+COLUMNS = ['chart', 'version', 'check', 'result']
+
+
+def test_rows_come_back_in_column_order():
+    store = RowStore(COLUMNS, ['version', 'chart'])
+    first = store.meta(['1.0.0', 'app'])
+    second = store.meta(['2.0.0', 'other'])
+    store.append(first, ['CKV_K8S_1', 'PASSED'])
+    store.append(second, ['CKV_K8S_2', 'FAILED'])
+    store.append(first, ['CKV_K8S_3', 'FAILED'])
+
+    assert len(store) == 3
+    assert list(store.rows()) == [
+        ('app', '1.0.0', 'CKV_K8S_1', 'PASSED'),
+        ('other', '2.0.0', 'CKV_K8S_2', 'FAILED'),
+        ('app', '1.0.0', 'CKV_K8S_3', 'FAILED'),
+    ]
+
+
+def test_meta_tuples_are_shared_and_strings_interned():
+    store = RowStore(COLUMNS, ['chart', 'version'])
+    metaId = store.meta(['app', '1.0.0'])
+
+    assert store.meta(['app', ''.join(['1.0', '.0'])]) == metaId
+    assert len(store.metas) == 1
+    store.append(metaId, [''.join(['CKV_', 'K8S_1']), 'PASSED'])
+    store.append(metaId, [''.join(['CKV_', 'K8S_1']), 'PASSED'])
+    assert store.values[0][0] is store.values[0][1]
+
+
+def test_frame_matches_rows():
+    store = RowStore(COLUMNS, ['chart', 'version'])
+    metaId = store.meta(['app', '1.0.0'])
+    store.append(metaId, ['CKV_K8S_1', 'PASSED'])
+    store.append(metaId, ['CKV_K8S_2', None])
+
+    frame = store.frame()
+    assert list(frame.columns) == COLUMNS
+    assert [tuple(row) for row in frame.itertuples(index=False)] == list(store.rows())
+
+
+def test_empty_store_has_the_table_columns():
+    frame = row_store.check_store().frame()
+
+    assert list(frame.columns) == row_store.CHECK_COLUMNS
+    assert len(frame) == 0
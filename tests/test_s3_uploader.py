@@ -0,0 +1,130 @@
+import os
+import threading
+
+import boto3
+import pytest
+from boto3.s3.transfer import TransferConfig
+from moto import mock_s3
+
+from helmScanner.output.s3_uploader import MB, UploadQueue
+
+BUCKET = 'helm-scanner-results'
+
+
+class CountingClient:
+    """
+    An S3 client counting upload_file calls per key. Uploads of keys in block wait for its event.
+    """
+
+    def __init__(self, client, block=None):
+        self.client = client
+        self.block = block or {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    def upload_file(self, path, bucket, key, **kwargs):
+        with self.lock:
+            self.uploads[key] = self.uploads.get(key, 0) + 1
+        if key in self.block:
+            self.block[key].wait(5)
+        return self.client.upload_file(path, bucket, key, **kwargs)
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv('RESULT_BUCKET', BUCKET)
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.delenv('S3_ENDPOINT_URL', raising=False)
+    with mock_s3():
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+def _queue(resultsPath, client, block=None):
+    queue = UploadQueue(str(resultsPath), 'run', 4, TransferConfig(multipart_threshold=5 * MB, multipart_chunksize=5 * MB))
+    queue.client = CountingClient(client, block)
+    return queue
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_enqueued_files_are_uploaded_and_recorded(tmp_path, s3):
+    queue = _queue(tmp_path, s3)
+    path = _write(tmp_path / 'checks' / 'org.csv', b'a,b\n1,2\n')
+
+    queue.enqueue(path)
+    queue.flush()
+
+    assert s3.get_object(Bucket=BUCKET, Key='results/run/checks/org.csv')['Body'].read() == b'a,b\n1,2\n'
+    assert queue.client.uploads == {'results/run/checks/org.csv': 1}
+    assert (tmp_path / 'upload-manifest.jsonl').read_text().count('results/run/checks/org.csv') == 1
+
+
+def test_manifest_skips_unchanged_files_across_runs(tmp_path, s3):
+    unchanged = _write(tmp_path / 'checks' / 'org.csv', b'a,b\n')
+    _write(tmp_path / 'deps' / 'global-deps-table.csv', b'deps\n')
+    first = _queue(tmp_path, s3)
+    first.sweep()
+    first.flush()
+
+    _write(tmp_path / 'deps' / 'global-deps-table.csv', b'deps, more of them\n')
+    second = _queue(tmp_path, s3)
+    second.sweep()
+    second.enqueue(unchanged)
+    second.flush()
+
+    assert second.client.uploads == {'results/run/deps/global-deps-table.csv': 1}
+    assert s3.get_object(Bucket=BUCKET, Key='results/run/deps/global-deps-table.csv')['Body'].read() == b'deps, more of them\n'
+
+
+def test_files_enqueued_while_uploading_are_uploaded_once(tmp_path, s3):
+    release = threading.Event()
+    queue = _queue(tmp_path, s3, block={'results/run/parquet/checks.parquet': release})
+    path = _write(tmp_path / 'parquet' / 'checks.parquet', b'PAR1')
+
+    queue.enqueue(path)
+    while not queue.client.uploads:
+        threading.Event().wait(0.01)
+    queue.sweep()
+    queue.enqueue(path)
+    release.set()
+    queue.flush()
+
+    assert queue.client.uploads == {'results/run/parquet/checks.parquet': 1}
+
+
+def test_files_rewritten_while_uploading_are_uploaded_again(tmp_path, s3):
+    release = threading.Event()
+    queue = _queue(tmp_path, s3, block={'results/run/deps/global-deps-list.csv': release})
+    path = _write(tmp_path / 'deps' / 'global-deps-list.csv', b'old\n')
+
+    queue.enqueue(path)
+    while not queue.client.uploads:
+        threading.Event().wait(0.01)
+    _write(tmp_path / 'deps' / 'global-deps-list.csv', b'new and longer\n')
+    queue.enqueue(path)
+    release.set()
+    queue.flush()
+
+    assert queue.client.uploads == {'results/run/deps/global-deps-list.csv': 2}
+    assert s3.get_object(Bucket=BUCKET, Key='results/run/deps/global-deps-list.csv')['Body'].read() == b'new and longer\n'
+
+
+def test_large_files_are_uploaded_in_parts(tmp_path, s3):
+    queue = _queue(tmp_path, s3)
+    data = os.urandom(6 * MB)
+    path = _write(tmp_path / 'containers' / 'vulnerabilities.csv', data)
+
+    queue.enqueue(path)
+    queue.flush()
+
+    uploaded = s3.get_object(Bucket=BUCKET, Key='results/run/containers/vulnerabilities.csv')
+    assert uploaded['ETag'].strip('"').endswith('-2')
+    assert uploaded['Body'].read() == data
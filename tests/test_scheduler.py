@@ -0,0 +1,92 @@
+import os
+import threading
+
+import pytest
+
+from helmScanner.scheduler import WorkScheduler
+
+# Set in the test process only, to check process lane workers don't inherit this process's state.
+PARENT_STATE = None
+
+
+def _worker_view(value):
+    return os.getpid(), PARENT_STATE, value * 2
+
+
+def test_process_lane_workers_start_clean():
+    global PARENT_STATE
+    PARENT_STATE = 'parent only'
+    scheduler = WorkScheduler({'checkov': 2})
+    try:
+        scheduler.use_processes('checkov', preload=[__name__])
+        results = [scheduler.run('checkov', _worker_view, value) for value in range(4)]
+    finally:
+        scheduler.shutdown()
+        PARENT_STATE = None
+
+    assert [doubled for pid, state, doubled in results] == [0, 2, 4, 6]
+    assert all(pid != os.getpid() and state is None for pid, state, doubled in results)
+    assert scheduler.lanes['checkov'].metrics()['completed'] == 4
+
+
+def test_map_stream_holds_the_iterable_back():
+    scheduler = WorkScheduler({'org': 2})
+    release = threading.Event()
+    pulled = []
+
+    def items():
+        for item in range(10):
+            pulled.append(item)
+            yield item
+
+    def work(item):
+        release.wait(5)
+
+    thread = threading.Thread(target=scheduler.map_stream, args=('org', work, items(), 1))
+    thread.start()
+    try:
+        # Two running plus one pending, and the generator is blocked handing over the fourth.
+        for _ in range(100):
+            if len(pulled) >= 4:
+                break
+            threading.Event().wait(0.01)
+        assert len(pulled) == 4
+    finally:
+        release.set()
+        thread.join(5)
+        scheduler.shutdown()
+    assert len(pulled) == 10
+
+
+def test_map_stream_raises_the_first_failure_after_all_items():
+    scheduler = WorkScheduler({'org': 2})
+    done = []
+
+    def work(item):
+        if item == 1:
+            raise ValueError(item)
+        done.append(item)
+
+    with pytest.raises(ValueError):
+        scheduler.map_stream('org', work, range(5))
+    scheduler.shutdown()
+    assert sorted(done) == [0, 2, 3, 4]
+
+
+def test_map_stream_waits_for_submitted_items_when_the_iterable_fails():
+    scheduler = WorkScheduler({'org': 2})
+    done = []
+
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError('crawl failed')
+
+    def work(item):
+        threading.Event().wait(0.1)
+        done.append(item)
+
+    with pytest.raises(RuntimeError):
+        scheduler.map_stream('org', work, items())
+    assert sorted(done) == [1, 2]
+    scheduler.shutdown()
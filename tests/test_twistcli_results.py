@@ -0,0 +1,82 @@
+import io
+import json
+
+import pytest
+
+from helmScanner import image_scanner
+from helmScanner.image_scanner import ImageScanner
+from helmScanner.vulnerability_cache import VulnerabilityCache
+
+DIGEST = 'sha256:' + 'e' * 64
+IMAGE_ID = 'sha256:' + 'f' * 64
+DISTRIBUTION = {'total': 2, 'critical': 1, 'high': 1, 'medium': 0, 'low': 0}
+
+
+def _vulnerability(cve, severity):
+    return {'id': cve, 'status': 'fixed in 1.2', 'severity': severity, 'packageName': 'openssl', 'packageVersion': '1.1',
+            'link': f'https://nvd.nist.gov/vuln/detail/{cve}', 'cvss': 9.8, 'vector': 'AV:N', 'description': 'bad',
+            'riskFactors': {'has fix': {}, 'remote execution': {}}, 'publishedDays': 3}
+
+
+def _document(results):
+    # Keys are written in the given order, so the distribution can come after the vulnerabilities as it does from twistcli.
+    return io.BytesIO(json.dumps({'results': results}).encode())
+
+
+FIRST_RESULT = {
+    'id': IMAGE_ID,
+    'vulnerabilities': [_vulnerability('CVE-2021-0001', 'critical'), _vulnerability('CVE-2021-0002', 'high')],
+    'vulnerabilityDistribution': DISTRIBUTION,
+}
+SECOND_RESULT = {
+    'id': 'sha256:other',
+    'vulnerabilities': [_vulnerability('CVE-2021-9999', 'low')],
+    'vulnerabilityDistribution': {'total': 1, 'critical': 0, 'high': 0, 'medium': 0, 'low': 1},
+}
+
+
+@pytest.fixture(params=['ijson', 'json'])
+def scanner(request, tmp_path, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(image_scanner, 'ijson', None)
+    elif image_scanner.ijson is None:
+        pytest.skip('ijson is not installed')
+    # Built without __init__, which needs docker, twistcli and a Bridgecrew API key.
+    scanner = ImageScanner.__new__(ImageScanner)
+    scanner.vulnCache = VulnerabilityCache(str(tmp_path / 'vulnerabilities.sqlite'), 3600)
+    return scanner
+
+
+def test_distribution_after_the_vulnerabilities(scanner):
+    result = scanner.parse_results(IMAGE_ID, DIGEST, _document([FIRST_RESULT]))
+
+    assert result == image_scanner.ImageScanResult(IMAGE_ID, DIGEST, DISTRIBUTION)
+    assert scanner.vulnCache.get(DIGEST) == (IMAGE_ID, DISTRIBUTION)
+    rows = list(scanner.vulnCache.vulnerabilities(DIGEST))
+    assert [row[0] for row in rows] == ['CVE-2021-0001', 'CVE-2021-0002']
+    assert rows[0][1:6] == ('fixed in 1.2', 'critical', 'openssl', '1.1', 'https://nvd.nist.gov/vuln/detail/CVE-2021-0001')
+    assert rows[0][-3:] == (1, 0, 1)
+
+
+def test_only_the_first_result_is_read(scanner):
+    scanner.parse_results(IMAGE_ID, DIGEST, _document([FIRST_RESULT, SECOND_RESULT]))
+
+    assert scanner.vulnCache.get(DIGEST) == (IMAGE_ID, DISTRIBUTION)
+    assert [row[0] for row in scanner.vulnCache.vulnerabilities(DIGEST)] == ['CVE-2021-0001', 'CVE-2021-0002']
+
+
+def test_missing_distribution_raises_and_caches_nothing(scanner):
+    result = dict(FIRST_RESULT)
+    del result['vulnerabilityDistribution']
+
+    with pytest.raises((ValueError, KeyError)):
+        scanner.parse_results(IMAGE_ID, DIGEST, _document([result]))
+    assert scanner.vulnCache.get(DIGEST) is None
+    assert list(scanner.vulnCache.vulnerabilities(DIGEST)) == []
+
+
+def test_image_without_vulnerabilities(scanner):
+    clean = {'id': IMAGE_ID, 'vulnerabilityDistribution': {'total': 0, 'critical': 0, 'high': 0, 'medium': 0, 'low': 0}}
+
+    assert scanner.parse_results(IMAGE_ID, DIGEST, _document([clean])).distribution['total'] == 0
+    assert list(scanner.vulnCache.vulnerabilities(DIGEST)) == []
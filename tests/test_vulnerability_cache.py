@@ -0,0 +1,92 @@
+import pytest
+
+from helmScanner import vulnerability_cache
+from helmScanner.vulnerability_cache import VulnerabilityCache
+
+DIGEST = 'sha256:' + 'a' * 64
+DISTRIBUTION = {'total': 3, 'critical': 0, 'high': 1, 'medium': 2, 'low': 0}
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(vulnerability_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return VulnerabilityCache(str(tmp_path / 'vulnerabilities.sqlite'), ttlSeconds=3600)
+
+
+def test_scans_expire_after_the_ttl(cache, clock):
+    cache.put(DIGEST, 'image', DISTRIBUTION, [('CVE-1', 'high')])
+
+    clock.now += 3600
+    assert cache.get(DIGEST) == ('image', DISTRIBUTION)
+    clock.now += 1
+    assert cache.get(DIGEST) is None
+
+
+def test_references_expire_after_the_ttl(cache, clock):
+    cache.remember('redis:6.2', DIGEST)
+
+    clock.now += 3600
+    assert cache.digest_for('redis:6.2') == DIGEST
+    clock.now += 1
+    assert cache.digest_for('redis:6.2') is None
+    assert cache.digest_for('nginx:latest') is None
+
+
+def test_remember_moves_a_reference_to_its_new_digest(cache, clock):
+    cache.remember('redis:6.2', DIGEST)
+    clock.now += 60
+    cache.remember('redis:6.2', 'sha256:' + 'b' * 64)
+
+    assert cache.digest_for('redis:6.2') == 'sha256:' + 'b' * 64
+
+
+def test_put_replaces_earlier_rows(cache, clock):
+    cache.put(DIGEST, 'image', DISTRIBUTION, [('CVE-1', 'high'), ('CVE-2', 'medium'), ('CVE-3', 'medium')])
+    clock.now += 7200
+    cache.put(DIGEST, 'image', {'total': 1, 'high': 1}, [('CVE-4', 'high')])
+
+    assert cache.get(DIGEST) == ('image', {'total': 1, 'critical': 0, 'high': 1, 'medium': 0, 'low': 0})
+    assert list(cache.vulnerabilities(DIGEST)) == [('CVE-4', 'high')]
+
+
+def test_vulnerabilities_come_back_in_stored_order(cache):
+    rows = [(f'CVE-{n}', 'low', n * 1.5, None) for n in (12, 3, 7, 1, 10)]
+    cache.put(DIGEST, 'image', DISTRIBUTION, iter(rows))
+    cache.put('sha256:' + 'c' * 64, 'other', DISTRIBUTION, [('CVE-99', 'high', 9.8, None)])
+
+    assert list(cache.vulnerabilities(DIGEST)) == rows
+
+
+def test_failed_put_keeps_the_previous_scan(cache):
+    cache.put(DIGEST, 'image', DISTRIBUTION, [('CVE-1', 'high')])
+
+    def rows():
+        yield ('CVE-2', 'high')
+        raise ValueError('truncated twistcli result')
+    with pytest.raises(ValueError):
+        cache.put(DIGEST, 'image', DISTRIBUTION, rows())
+
+    assert list(cache.vulnerabilities(DIGEST)) == [('CVE-1', 'high')]
+
+
+def test_cache_persists_across_opens(tmp_path):
+    path = str(tmp_path / 'vulnerabilities.sqlite')
+    VulnerabilityCache(path, 3600).put(DIGEST, 'image', DISTRIBUTION, [('CVE-1', 'high')])
+
+    reopened = VulnerabilityCache(path, 3600)
+    assert reopened.get(DIGEST) == ('image', DISTRIBUTION)